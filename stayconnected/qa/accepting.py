@@ -0,0 +1,62 @@
+"""
+Accepted answers.
+
+``accept_answer`` moves a question's accepted answer in one transaction: the
+question row is locked, ``is_correct`` is cleared on the previous answer and
+set on the new one in a single UPDATE, the question is completed, and both
+authors' ``accepted_count``/``reputation`` move by ``F()`` deltas. The number
+of statements doesn't depend on how many answers the question or its authors
+have, and concurrent accepts on one question queue up on the lock, so
+exactly one answer ends up accepted and the counters match it.
+
+The UPDATEs don't send the ``Answer``/``Question`` save signals, so the tag
+completed counters, ``updated_at`` and the response caches are kept up to
+date here.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from stayconnected.caching import invalidate, question_namespace, user_namespace
+from .models import Answer, Question, Tag, User
+
+
+def _per_user(deltas, scale=1):
+    return Case(*[When(pk=pk, then=Value(delta * scale)) for pk, delta in deltas.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def accept_answer(answer):
+    """Make ``answer`` its question's accepted answer. Returns False if it already was."""
+    with transaction.atomic():
+        question = Question.objects.select_for_update().only('id', 'completed').get(pk=answer.question_id)
+        accepted = dict(
+            Answer.objects.filter(question_id=question.pk, is_correct=True).values_list('id', 'author_id')
+        )
+        if list(accepted) == [answer.pk]:
+            return False
+
+        Answer.objects.filter(Q(pk=answer.pk) | Q(is_correct=True), question_id=question.pk).update(
+            is_correct=Case(When(pk=answer.pk, then=Value(True)), default=Value(False)),
+        )
+
+        deltas = {}
+        if answer.pk not in accepted:
+            deltas[answer.author_id] = 1
+        for pk, author_id in accepted.items():
+            if pk != answer.pk:
+                deltas[author_id] = deltas.get(author_id, 0) - 1
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if deltas:
+            User.objects.filter(id__in=list(deltas)).update(
+                accepted_count=F('accepted_count') + _per_user(deltas),
+                reputation=F('reputation') + _per_user(deltas, User.reputation_delta(accepted=1)),
+            )
+
+        Question.objects.filter(pk=question.pk).update(completed=True, updated_at=timezone.now())
+        if not question.completed:
+            Tag.objects.filter(questions=question.pk).update(completed_count=F('completed_count') + 1)
+            invalidate('tag-counts')
+
+    invalidate('questions', question_namespace(question.pk), *[user_namespace(pk) for pk in deltas])
+    return True
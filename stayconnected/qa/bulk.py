@@ -0,0 +1,274 @@
+"""
+Streaming NDJSON export/import of users, tags, questions, answers and votes.
+
+One JSON object per line, tagged with ``"type"``, in dependency order:
+users, tags, questions (with their tag names), answers, then votes. Primary
+keys are kept so references survive the round trip. Tags are matched by name,
+so questions can be loaded next to tags that already exist. Counters, search
+vectors and reputation are not exported; the import recomputes them in bulk.
+"""
+import datetime
+import json
+import weakref
+from contextlib import contextmanager
+from itertools import groupby
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import signals
+
+from stayconnected.caching import invalidate
+from user.authentication import user_cache
+from .models import Answer, Question, Tag, User
+from .search import get_search_backend
+from .tag_index import tag_index
+from .tags import normalize_tag_name, reconcile_tag_counts, tag_resolver
+from .trending import recompute_trending
+from .votes import DISLIKE, LIKE, Dislikes, Likes, reconcile_vote_counts, votes_changed
+
+# Derived columns, recomputed after an import rather than copied
+DERIVED_FIELDS = {
+    User: {'like_count', 'dislike_count', 'accepted_count', 'reputation', 'answer_count'},
+    Question: {'search_vector', 'trending_score'},
+    Answer: {'like_count', 'dislike_count', 'score'},
+    Tag: {'question_count', 'completed_count'},
+}
+RECORD_TYPES = {'user': User, 'tag': Tag, 'question': Question, 'answer': Answer}
+VOTE_TABLES = {LIKE: Likes, DISLIKE: Dislikes}
+MUTED_MODULES = ('qa.signals', 'user.signals')
+MUTED_SIGNALS = (
+    signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete,
+    signals.m2m_changed, votes_changed,
+)
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds; keep timestamps exact
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _fields(model):
+    excluded = DERIVED_FIELDS.get(model, set())
+    return [field for field in model._meta.concrete_fields if field.name not in excluded]
+
+
+def _receiver_module(entry):
+    receiver = entry[1]
+    if isinstance(receiver, weakref.ReferenceType):
+        receiver = receiver()
+    return getattr(receiver, '__module__', None)
+
+
+@contextmanager
+def receivers_muted(modules=MUTED_MODULES):
+    """Temporarily detach every receiver defined in ``modules``."""
+    saved = []
+    for signal in MUTED_SIGNALS:
+        with signal.lock:
+            saved.append((signal, signal.receivers))
+            signal.receivers = [entry for entry in signal.receivers if _receiver_module(entry) not in modules]
+            signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            with signal.lock:
+                signal.receivers = receivers
+                signal.sender_receivers_cache.clear()
+
+
+@contextmanager
+def timestamps_preserved(models=(User, Question, Answer)):
+    """bulk_create would stamp auto_now(_add) fields with the current time."""
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def export_records(using, chunk_size=2000):
+    """Yield every record as a dict, reading each table with a server-side cursor."""
+    for record_type, model in (('user', User), ('tag', Tag)):
+        fields = _fields(model)
+        rows = model.objects.using(using).order_by('pk').values_list(*[field.attname for field in fields])
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield {'type': record_type, **dict(zip((field.attname for field in fields), row))}
+
+    # Questions and their tags are two ordered streams merged on question id
+    tag_names = dict(Tag.objects.using(using).values_list('id', 'name'))
+    links = Question.tags.through.objects.using(using).order_by('question_id').values_list('question_id', 'tag_id')
+    links = groupby(links.iterator(chunk_size=chunk_size), key=lambda link: link[0])
+    pending = next(links, None)
+    fields = _fields(Question)
+    rows = Question.objects.using(using).order_by('pk').values_list(*[field.attname for field in fields])
+    for row in rows.iterator(chunk_size=chunk_size):
+        record = {'type': 'question', **dict(zip((field.attname for field in fields), row))}
+        while pending is not None and pending[0] < record['id']:
+            pending = next(links, None)
+        tags = []
+        if pending is not None and pending[0] == record['id']:
+            tags = [tag_names[tag_id] for _, tag_id in pending[1]]
+            pending = next(links, None)
+        record['tags'] = tags
+        yield record
+
+    fields = _fields(Answer)
+    rows = Answer.objects.using(using).order_by('pk').values_list(*[field.attname for field in fields])
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield {'type': 'answer', **dict(zip((field.attname for field in fields), row))}
+
+    for value, through in VOTE_TABLES.items():
+        rows = through.objects.using(using).order_by('pk').values_list('answer_id', 'user_id')
+        for answer_id, user_id in rows.iterator(chunk_size=chunk_size):
+            yield {'type': 'vote', 'answer': answer_id, 'user': user_id, 'value': value}
+
+
+def export_ndjson(stream, using, chunk_size=2000):
+    """Write the export to ``stream``. Returns the number of records per type."""
+    encoder = ExportEncoder(ensure_ascii=False, separators=(',', ':'))
+    counts = {}
+    with transaction.atomic(using=using):
+        if connections[using].vendor == 'postgresql':
+            # One snapshot for all tables, so no answer points at a question the export missed
+            with connections[using].cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        for record in export_records(using, chunk_size):
+            stream.write(encoder.encode(record) + '\n')
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+    return counts
+
+
+class NDJSONImporter:
+    """
+    Buffers records of one type and writes them with ``bulk_create`` every
+    ``batch_size`` rows, so memory stays flat however large the input is.
+    Records must come in export order: a batch is flushed whenever the type
+    changes, before anything that may reference it is written.
+    """
+
+    def __init__(self, using, batch_size=5000):
+        self.using = using
+        self.batch_size = batch_size
+        self.buffer_type = None
+        self.buffer = []
+        self.counts = {}
+        self.tag_ids = None
+
+    def add(self, record):
+        record_type = record.pop('type')
+        if record_type not in RECORD_TYPES and record_type != 'vote':
+            raise ValueError(f'Unknown record type: {record_type!r}')
+        if record_type != self.buffer_type or len(self.buffer) >= self.batch_size:
+            self.flush()
+            self.buffer_type = record_type
+        self.buffer.append(record)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        record_type, records = self.buffer_type, self.buffer
+        self.buffer = []
+        if record_type == 'vote':
+            self._write_votes(records)
+        elif record_type == 'question':
+            self._write_questions(records)
+        elif record_type == 'tag':
+            for record in records:
+                record['name'] = normalize_tag_name(record['name'])
+            self._write(Tag, records, ignore_conflicts=True)
+        else:
+            self._write(RECORD_TYPES[record_type], records)
+        self.counts[record_type] = self.counts.get(record_type, 0) + len(records)
+
+    def _write(self, model, records, ignore_conflicts=False):
+        fields = _fields(model)
+        objs = [
+            model(**{field.attname: field.to_python(record[field.attname]) for field in fields if field.attname in record})
+            for record in records
+        ]
+        model.objects.using(self.using).bulk_create(objs, ignore_conflicts=ignore_conflicts)
+        if model is Tag:
+            self.tag_ids = None
+
+    def resolve_tags(self, names):
+        """Map tag names to ids, creating the ones that do not exist yet."""
+        if self.tag_ids is None:
+            self.tag_ids = dict(Tag.objects.using(self.using).values_list('name', 'id'))
+        missing = {name for name in names if name not in self.tag_ids}
+        if missing:
+            Tag.objects.using(self.using).bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            self.tag_ids.update(Tag.objects.using(self.using).filter(name__in=missing).values_list('name', 'id'))
+        return self.tag_ids
+
+    def _write_questions(self, records):
+        tags = {record['id']: [normalize_tag_name(name) for name in record.pop('tags', [])] for record in records}
+        self._write(Question, records)
+        tag_ids = self.resolve_tags({name for names in tags.values() for name in names})
+        Question.tags.through.objects.using(self.using).bulk_create([
+            Question.tags.through(question_id=question_id, tag_id=tag_ids[name])
+            for question_id, names in tags.items()
+            for name in set(names)
+        ], ignore_conflicts=True)
+
+    def _write_votes(self, records):
+        rows = {value: [] for value in VOTE_TABLES}
+        for record in records:
+            rows[record['value']].append((record['answer'], record['user']))
+        for value, through in VOTE_TABLES.items():
+            through.objects.using(self.using).bulk_create(
+                [through(answer_id=answer_id, user_id=user_id) for answer_id, user_id in rows[value]],
+                ignore_conflicts=True,
+            )
+
+    def finish(self):
+        """Flush, then recompute everything the skipped receivers would have maintained."""
+        self.flush()
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Tag, Question, Answer, Likes, Dislikes]):
+                cursor.execute(sql)
+        recompute_derived(self.using)
+
+
+def recompute_derived(using):
+    """Rebuild counters, reputation, trending scores and the search index after a bulk load."""
+    reconcile_vote_counts(using=using)
+    reconcile_tag_counts(using=using)
+    recompute_trending(using=using)
+    get_search_backend(using).rebuild()
+
+
+def reset_in_process_state():
+    """Forget in-memory state that a bulk load bypassed."""
+    tag_index.reset()
+    tag_resolver.clear()
+    user_cache.clear()
+    invalidate('tags', 'tag-counts', 'questions', 'users')
+
+
+def import_ndjson(stream, using, batch_size=5000):
+    """Load an export from ``stream``. Returns the number of records per type."""
+    importer = NDJSONImporter(using, batch_size)
+    with receivers_muted(), timestamps_preserved(), transaction.atomic(using=using):
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                importer.add(json.loads(line))
+            except (ValueError, KeyError) as exc:
+                raise ValueError(f'Line {line_number}: {exc}') from exc
+        importer.finish()
+    reset_in_process_state()
+    return importer.counts
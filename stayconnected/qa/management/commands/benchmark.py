@@ -0,0 +1,56 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from qa.seeding import SIZES
+from stayconnected import benchmark
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every qa/user endpoint against seeded test databases and fail on query count '
+        'regressions. Run it with --settings=stayconnected.settings_test to stay on SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help=f'Comma separated dataset sizes ({", ".join(SIZES)}).')
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the query counts to --baseline instead of comparing.')
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = set(sizes) - set(SIZES)
+        if unknown:
+            raise CommandError(f'Unknown sizes: {", ".join(sorted(unknown))}')
+        try:
+            benchmark.check_coverage()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = benchmark.run(sizes, iterations=options['iterations'], seed=options['seed'],
+                                log=self.stdout.write)
+        if options['output']:
+            benchmark.save(results, options['output'])
+
+        if options['update_baseline']:
+            baseline = benchmark.load(options['baseline']) if os.path.exists(options['baseline']) else {}
+            baseline.update(benchmark.query_counts(results))
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            benchmark.save(baseline, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {options["baseline"]}.'))
+            return
+
+        if not os.path.exists(options['baseline']):
+            raise CommandError(f'No baseline at {options["baseline"]}; run with --update-baseline first.')
+        regressions = benchmark.compare(results, benchmark.load(options['baseline']))
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from qa.seeding import SIZES
+from stayconnected import benchmark, encoding_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the encode time and size of JSON, orjson and MessagePack responses, raw and compressed, on '
+        'a seeded feed page. Run it with --settings=stayconnected.settings_test to stay on SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='medium', help=f'Dataset size ({", ".join(SIZES)}).')
+        parser.add_argument('--questions', type=int, default=100, help='Questions in the encoded page.')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        if options['size'] not in SIZES:
+            raise CommandError(f'Unknown size: {options["size"]}')
+        results = encoding_benchmark.run(options['size'], questions=options['questions'],
+                                         iterations=options['iterations'], seed=options['seed'])
+        if options['output']:
+            benchmark.save(results, options['output'])
+
+        baseline = results['json (DRF)']
+        for name, stats in results.items():
+            line = (f'{name:<14} {stats["bytes"]:>9} bytes ({stats["bytes"] / baseline["bytes"]:>4.0%})  '
+                    f'encode {stats["encode_ms"]:>7.2f} ms ({baseline["encode_ms"] / stats["encode_ms"]:>4.1f}x)')
+            for encoding in ('gzip', 'br'):
+                if f'{encoding}_bytes' in stats:
+                    line += f'  {encoding} {stats[f"{encoding}_bytes"]:>8} bytes in {stats[f"{encoding}_ms"]:>6.2f} ms'
+            self.stdout.write(line)
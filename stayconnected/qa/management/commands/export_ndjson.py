@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from qa.bulk import export_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Stream users, tags, questions, answers and votes as NDJSON (see qa.bulk for the format).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-', help='File to write (default: stdout).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip.')
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            counts = export_ndjson(self.stdout, options['database'], options['chunk_size'])
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                counts = export_ndjson(stream, options['database'], options['chunk_size'])
+        summary = ', '.join(f'{count} {record_type}(s)' for record_type, count in counts.items()) or 'nothing'
+        self.stderr.write(self.style.SUCCESS(f'Exported {summary}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from qa.votes import flush_vote_deltas
+
+
+class Command(BaseCommand):
+    help = 'Apply every staged vote counter change (see VOTES_WRITE_BEHIND), e.g. after the workers were down.'
+
+    def handle(self, *args, **options):
+        total = applied = flush_vote_deltas()
+        while applied:
+            applied = flush_vote_deltas()
+            total += applied
+        self.stdout.write(self.style.SUCCESS(f'Applied {total} staged vote(s).'))
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from qa.bulk import import_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Load an NDJSON export in bulk, with the qa/user signal receivers off, then recompute '
+        'counters, reputation and the search index. Primary keys are kept, so load into a '
+        'database whose ids do not overlap (tags are matched by name).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-', help='File to read (default: stdin).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk INSERT.')
+
+    def handle(self, *args, **options):
+        try:
+            if options['input'] == '-':
+                counts = import_ndjson(sys.stdin, options['database'], options['batch_size'])
+            else:
+                with open(options['input'], encoding='utf-8') as stream:
+                    counts = import_ndjson(stream, options['database'], options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        summary = ', '.join(f'{count} {record_type}(s)' for record_type, count in counts.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f'Imported {summary}.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from qa.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the question full-text search index from scratch (e.g. after a bulk import).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        with transaction.atomic(using=options['database']):
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index with {type(backend).__name__}.'))
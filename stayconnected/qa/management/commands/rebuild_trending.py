@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from qa.trending import recompute_trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute every question\'s trending score, e.g. after changing TRENDING_HALF_LIFE_HOURS.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recompute_trending()
+        self.stdout.write(self.style.SUCCESS('Trending scores rebuilt.'))
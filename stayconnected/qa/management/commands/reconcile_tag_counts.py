@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from qa.tags import reconcile_tag_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-tag question/completed counters from the question tags.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            reconcile_tag_counts()
+        self.stdout.write(self.style.SUCCESS('Recomputed tag counts.'))
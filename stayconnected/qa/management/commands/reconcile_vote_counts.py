@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from qa.votes import reconcile_vote_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute answer and user like/dislike counters from the vote tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('answer_ids', nargs='*', type=int, help='Only these answers (default: all).')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = reconcile_vote_counts(options['answer_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Fixed {drifted} answer(s) with drifted vote counts.'))
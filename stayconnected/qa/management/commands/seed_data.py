@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from qa.seeding import SEED_PASSWORD, SIZES, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, Zipf-distributed tags, questions, answers and votes. '
+        f'Seeded users log in with the password "{SEED_PASSWORD}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(SIZES), default='small',
+                            help='Preset for --users/--tags/--questions.')
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--tags', type=int)
+        parser.add_argument('--questions', type=int)
+        parser.add_argument('--answers', type=float, default=3.0, help='Mean answers per question.')
+        parser.add_argument('--votes', type=float, default=5.0, help='Mean votes per answer.')
+        parser.add_argument('--tags-per-question', type=int, default=3)
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for tags and user activity.')
+        parser.add_argument('--days', type=int, default=365, help='Spread questions over this many days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        counts = {name: options[name] if options[name] is not None else value
+                  for name, value in SIZES[options['size']].items()}
+        if counts['users'] < 2 or counts['tags'] < 1:
+            raise CommandError('Need at least 2 users and 1 tag.')
+        seeder = Seeder(
+            **counts, answers=options['answers'], votes=options['votes'],
+            tags_per_question=options['tags_per_question'], skew=options['skew'], days=options['days'],
+            seed=options['seed'], batch_size=options['batch_size'],
+        )
+        created = seeder.run()
+        summary = ', '.join(f'{count} {name}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}.'))
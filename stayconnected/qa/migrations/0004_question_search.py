@@ -0,0 +1,46 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:02
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE qa_question SET search_vector = "
+            "setweight(to_tsvector('english'::regconfig, COALESCE(title, '')), 'A') || "
+            "setweight(to_tsvector('english'::regconfig, COALESCE(description, '')), 'B')"
+        )
+        schema_editor.execute('CREATE INDEX qa_question_search_idx ON qa_question USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE qa_question_fts USING fts5(title, description, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            'INSERT INTO qa_question_fts (rowid, title, description) SELECT id, title, description FROM qa_question'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS qa_question_search_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS qa_question_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0003_question_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_counts(apps, schema_editor):
+    Answer = apps.get_model('qa', 'Answer')
+
+    def vote_count(through):
+        return Coalesce(
+            Subquery(
+                through.objects.filter(answer_id=OuterRef('pk'))
+                .values('answer_id')
+                .annotate(total=Count('*'))
+                .values('total')
+            ),
+            Value(0),
+        )
+
+    Answer.objects.update(
+        like_count=vote_count(Answer.likes.through),
+        dislike_count=vote_count(Answer.dislikes.through),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0004_question_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='dislike_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counts, migrations.RunPython.noop),
+    ]
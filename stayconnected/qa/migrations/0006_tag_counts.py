@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_tag_counts(apps, schema_editor):
+    Tag = apps.get_model('qa', 'Tag')
+    through = apps.get_model('qa', 'Question').tags.through
+
+    def question_count(**filters):
+        return Coalesce(
+            Subquery(
+                through.objects.filter(tag_id=OuterRef('pk'), **filters)
+                .values('tag_id')
+                .annotate(total=Count('*'))
+                .values('total')
+            ),
+            Value(0),
+        )
+
+    Tag.objects.update(
+        question_count=question_count(),
+        completed_count=question_count(question__completed=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0005_answer_vote_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-question_count', '-id'], name='qa_tag_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['name'], name='qa_tag_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_tag_counts, migrations.RunPython.noop),
+    ]
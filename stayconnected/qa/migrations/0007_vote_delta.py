@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0006_tag_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('like_delta', models.SmallIntegerField(default=0)),
+                ('dislike_delta', models.SmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('answer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='qa.answer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:44
+
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_trending_scores(apps, schema_editor):
+    from qa.trending import ANSWER_WEIGHT, LIKE_WEIGHT, QUESTION_WEIGHT, event_score
+
+    Question = apps.get_model('qa', 'Question')
+    Answer = apps.get_model('qa', 'Answer')
+    events = defaultdict(list)
+    for pk, created_at in Question.objects.values_list('id', 'created_at').iterator():
+        events[pk].append(event_score(QUESTION_WEIGHT, created_at))
+    for question_id, created_at, likes in Answer.objects.values_list('question_id', 'created_at', 'like_count').iterator():
+        events[question_id].append(event_score(ANSWER_WEIGHT, created_at))
+        if likes > 0:
+            events[question_id].append(event_score(LIKE_WEIGHT * likes, created_at))
+    rows = []
+    for pk, scores in events.items():
+        top = max(scores)
+        rows.append(Question(pk=pk, trending_score=top + math.log(sum(math.exp(score - top) for score in scores))))
+    Question.objects.bulk_update(rows, ['trending_score'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0007_vote_delta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-trending_score', '-id'], name='qa_question_trending_idx'),
+        ),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
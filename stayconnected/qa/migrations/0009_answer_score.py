@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_answer_scores(apps, schema_editor):
+    apps.get_model('qa', 'Answer').objects.update(score=F('like_count') - F('dislike_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0008_question_trending_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_answer_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-is_correct', '-score', '-id'], name='qa_answer_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'created_at', 'id'], name='qa_answer_thread_idx'),
+        ),
+    ]
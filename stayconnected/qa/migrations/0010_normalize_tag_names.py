@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def normalize_tag_names(apps, schema_editor):
+    """
+    Lower-case and trim tag names the way qa.tags looks them up, merging tags
+    that only differed in case into one (the already normalized tag if there
+    is one, else the oldest) and moving their questions over.
+    """
+    Tag = apps.get_model('qa', 'Tag')
+    through = apps.get_model('qa', 'Question').tags.through
+
+    groups = defaultdict(list)
+    for tag_id, name in Tag.objects.order_by('id').values_list('id', 'name'):
+        groups[name.strip().lower()].append((tag_id, name))
+
+    merged = []
+    for name, tags in groups.items():
+        if not name or all(tag_name == name for _, tag_name in tags):
+            continue
+        keep = next((tag_id for tag_id, tag_name in tags if tag_name == name), tags[0][0])
+        for tag_id, _ in tags:
+            if tag_id == keep:
+                continue
+            through.objects.filter(
+                tag_id=tag_id, question_id__in=through.objects.filter(tag_id=keep).values('question_id'),
+            ).delete()
+            through.objects.filter(tag_id=tag_id).update(tag_id=keep)
+            Tag.objects.filter(id=tag_id).delete()
+        Tag.objects.filter(id=keep).update(name=name)
+        merged.append(keep)
+
+    def question_count(**filters):
+        return Coalesce(
+            Subquery(
+                through.objects.filter(tag_id=OuterRef('pk'), **filters)
+                .values('tag_id')
+                .annotate(total=Count('*'))
+                .values('total')
+            ),
+            Value(0),
+        )
+
+    Tag.objects.filter(id__in=merged).update(
+        question_count=question_count(),
+        completed_count=question_count(question__completed=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0009_answer_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_tag_names, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,31 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 
 User = get_user_model()
 
 
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # Denormalized from Question.tags, maintained by qa.signals
+    question_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-question_count', '-id'], name='qa_tag_popularity_idx'),
+            # The unique index can't serve LIKE 'prefix%' under a non-C collation on PostgreSQL
+            models.Index(fields=['name'], name='qa_tag_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def open_count(self):
+        return self.question_count - self.completed_count
+
 
 class Question(models.Model):
     title = models.CharField(max_length=255)
@@ -19,10 +35,40 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed = models.BooleanField(default=False)
+    # Maintained by qa.search on PostgreSQL only; always NULL elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Decayed activity in log space, maintained by qa.trending
+    trending_score = models.FloatField(default=0, editable=False)
+
+    COUNTER_FIELDS = {'trending_score'}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='qa_question_feed_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='qa_question_trending_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Like Answer's counters, the score only moves through F() updates
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def touch(cls, question_ids):
+        """
+        Bump updated_at without loading the rows. It is the version stamp
+        behind the ETags of the question views, so anything shown with a
+        question (answers, votes, tags, author names) calls this on change.
+        """
+        cls.objects.filter(id__in=question_ids).update(updated_at=timezone.now())
+
     def check_completion(self):
         """
         Check if the question has a correct answer and update completion status
@@ -30,7 +76,8 @@ class Question(models.Model):
         has_correct_answer = self.answers.filter(is_correct=True).exists()
         if has_correct_answer and not self.completed:
             self.completed = True
-            self.save()
+            # Not a plain save(): that lists title/description and would reindex the question
+            self.save(update_fields=['completed', 'updated_at'])
 
 
 class Answer(models.Model):
@@ -40,7 +87,43 @@ class Answer(models.Model):
     is_correct = models.BooleanField(default=False)
     likes = models.ManyToManyField(User, related_name='liked_answers', blank=True)
     dislikes = models.ManyToManyField(User, related_name='disliked_answers', blank=True)
+    # Denormalized from likes/dislikes, maintained by qa.votes
+    like_count = models.IntegerField(default=0)
+    dislike_count = models.IntegerField(default=0)
+    # like_count - dislike_count, stored so answers can be paged by it
+    score = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    COUNTER_FIELDS = {'like_count', 'dislike_count', 'score'}
+
+    class Meta:
+        indexes = [
+            # The answer list orderings (qa.views.AnswerPagination); read backwards for newest first
+            models.Index(fields=['question', '-is_correct', '-score', '-id'], name='qa_answer_top_idx'),
+            models.Index(fields=['question', 'created_at', 'id'], name='qa_answer_thread_idx'),
+        ]
+
     def __str__(self):
         return f"Answer to {self.question.title} by {self.author.username}"
+
+    def save(self, *args, **kwargs):
+        # The counters only move through F() updates; a plain save() from an
+        # instance loaded before some votes must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class VoteDelta(models.Model):
+    """
+    A vote's counter change, staged by qa.votes when VOTES_WRITE_BEHIND is on
+    and folded into the answer (and its author) by the next flush.
+    """
+    # Rows of deleted answers update nothing when flushed, and are removed then
+    answer = models.ForeignKey(Answer, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    like_delta = models.SmallIntegerField(default=0)
+    dislike_delta = models.SmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,172 @@
+"""
+Full-text search over questions.
+
+PostgreSQL keeps a weighted ``tsvector`` per question in
+``Question.search_vector`` (GIN indexed, see migration 0004). SQLite keeps the
+same documents in an FTS5 table so search works locally and in tests. Other
+databases fall back to the old ``icontains`` scan.
+"""
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import F, Q
+
+from .models import Question, Tag
+
+SEARCH_CONFIG = 'english'
+SNIPPET_START = '<mark>'
+SNIPPET_STOP = '</mark>'
+FTS_TABLE = 'qa_question_fts'
+
+
+class BasicSearchBackend:
+    def __init__(self, using):
+        self.using = using
+
+    def index(self, question_ids):
+        pass
+
+    def remove(self, question_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, text, tag=None):
+        questions = Question.objects.using(self.using).filter(
+            Q(title__icontains=text) | Q(description__icontains=text)
+        )
+        if tag:
+            questions = questions.filter(tags__name=tag)
+        return questions.prefetch_related('tags').order_by('-created_at', '-id')
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    @staticmethod
+    def vector():
+        return (
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        )
+
+    def index(self, question_ids):
+        Question.objects.using(self.using).filter(id__in=question_ids).update(search_vector=self.vector())
+
+    def rebuild(self):
+        Question.objects.using(self.using).update(search_vector=self.vector())
+
+    def search(self, text, tag=None):
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        questions = Question.objects.using(self.using).filter(search_vector=query)
+        if tag:
+            questions = questions.filter(tags__name=tag)
+        return questions.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            snippet=SearchHeadline(
+                'description', query, config=SEARCH_CONFIG,
+                start_sel=SNIPPET_START, stop_sel=SNIPPET_STOP, max_words=35, min_words=15,
+            ),
+        ).prefetch_related('tags').order_by('-rank', '-id')
+
+
+class SQLiteSearchBackend(BasicSearchBackend):
+    # bm25() weights per column: title matches count double
+    rank_sql = f'bm25({FTS_TABLE}, 2.0, 1.0)'
+    snippet_sql = f"snippet({FTS_TABLE}, 1, '{SNIPPET_START}', '{SNIPPET_STOP}', '…', 24)"
+
+    def index(self, question_ids):
+        rows = Question.objects.using(self.using).filter(id__in=question_ids).values_list('id', 'title', 'description')
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in question_ids])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', list(rows))
+
+    def remove(self, question_ids):
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in question_ids])
+
+    def rebuild(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                f'SELECT id, title, description FROM {Question._meta.db_table}'
+            )
+
+    def search(self, text, tag=None):
+        return FTSResults(self, text, tag)
+
+
+class FTSResults:
+    """
+    Lazy, sliceable result set over the FTS5 table. It implements just enough
+    of the QuerySet interface (``count()`` and slicing) for Django's Paginator,
+    so only the requested page is ranked, highlighted and loaded.
+    """
+
+    def __init__(self, backend, text, tag):
+        self.backend = backend
+        self.match = ' '.join(f'"{token}"' for token in re.findall(r'\w+', text))
+        self.tag = tag
+
+    def _where(self):
+        where, params = f'{FTS_TABLE} MATCH %s', [self.match]
+        if self.tag:
+            through = Question.tags.through._meta.db_table
+            where += (
+                f' AND rowid IN (SELECT qt.question_id FROM {through} qt '
+                f'INNER JOIN {Tag._meta.db_table} t ON t.id = qt.tag_id WHERE t.name = %s)'
+            )
+            params.append(self.tag)
+        return where, params
+
+    def count(self):
+        if not self.match:
+            return 0
+        where, params = self._where()
+        with connections[self.backend.using].cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.match:
+            return []
+        offset = item.start or 0
+        limit = -1 if item.stop is None else item.stop - offset
+        where, params = self._where()
+        sql = (
+            f'SELECT rowid, {self.backend.rank_sql}, {self.backend.snippet_sql} FROM {FTS_TABLE} '
+            f'WHERE {where} ORDER BY {self.backend.rank_sql}, rowid DESC LIMIT %s OFFSET %s'
+        )
+        with connections[self.backend.using].cursor() as cursor:
+            cursor.execute(sql, params + [limit, offset])
+            hits = cursor.fetchall()
+
+        questions = Question.objects.using(self.backend.using).prefetch_related('tags').in_bulk(
+            [pk for pk, _, _ in hits]
+        )
+        results = []
+        for pk, rank, snippet in hits:
+            question = questions.get(pk)
+            if question is None:
+                continue
+            # bm25() is "lower is better"; flip it so rank sorts like SearchRank
+            question.rank = -rank
+            question.snippet = snippet
+            results.append(question)
+        return results
+
+
+def get_search_backend(using=None):
+    using = using or router.db_for_read(Question)
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend(using)
+    if vendor == 'sqlite':
+        return SQLiteSearchBackend(using)
+    return BasicSearchBackend(using)
@@ -0,0 +1,161 @@
+"""
+Synthetic Q&A data for development and benchmarks.
+
+Activity is skewed the way real forums are: tag popularity and how often a
+user asks, answers or votes follow Zipf distributions (exponent ``skew``),
+answer and vote counts per post are exponentially distributed around their
+means, and questions are spread over the last ``days`` days with ids in
+creation order. Everything is written with ``bulk_create`` in batches with
+the qa/user receivers off, then counters, reputation and the search index are
+recomputed once, like an NDJSON import. The same ``seed`` gives the same data.
+"""
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import receivers_muted, recompute_derived, reset_in_process_state, timestamps_preserved
+from .models import Answer, Question, Tag, User
+from .votes import Dislikes, Likes
+
+# Dataset presets used by the seed_data and benchmark commands
+SIZES = {
+    'small': {'users': 50, 'tags': 30, 'questions': 200},
+    'medium': {'users': 500, 'tags': 200, 'questions': 2000},
+    'large': {'users': 5000, 'tags': 1000, 'questions': 20000},
+}
+SEED_PASSWORD = 'seed-password'
+WORDS = (
+    'django python migrations deploy postgres query index cache serializer view model signal '
+    'queryset template middleware docker nginx celery redis async thread pool test fixture pytest '
+    'token jwt auth permission cors json api pagination cursor filter search vote tag answer '
+    'question user profile photo upload timeout error traceback memory leak slow fast bulk insert'
+).split()
+
+
+class Zipf:
+    """Draw indexes 0..n-1 with P(k) proportional to 1 / (k + 1) ** skew."""
+
+    def __init__(self, rng, n, skew):
+        self.rng = rng
+        self.population = range(n)
+        self.cum_weights = list(accumulate(1 / (k + 1) ** skew for k in range(n)))
+
+    def draw(self, count=1):
+        return self.rng.choices(self.population, cum_weights=self.cum_weights, k=count)
+
+
+class Seeder:
+    def __init__(self, users, tags, questions, answers=3.0, votes=5.0, tags_per_question=3, skew=1.1,
+                 accepted_ratio=0.4, days=365, seed=0, batch_size=2000):
+        self.users, self.tags, self.questions = users, tags, questions
+        self.answers, self.votes, self.tags_per_question = answers, votes, tags_per_question
+        self.accepted_ratio, self.days, self.batch_size = accepted_ratio, days, batch_size
+        self.rng = random.Random(seed)
+        self.skew = skew
+        self.counts = {}
+
+    def _count(self, name, number):
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    def _text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words))
+
+    def _poisson_like(self, mean, cap):
+        return min(int(self.rng.expovariate(1 / mean)), cap) if mean > 0 else 0
+
+    def run(self):
+        with receivers_muted(), timestamps_preserved(), transaction.atomic():
+            start = timezone.now() - timedelta(days=self.days)
+            user_ids = self.create_users(start)
+            tag_ids = self.create_tags()
+            self.user_dist = Zipf(self.rng, len(user_ids), self.skew)
+            self.tag_dist = Zipf(self.rng, len(tag_ids), self.skew)
+            offsets = sorted(self.rng.random() * self.days for _ in range(self.questions))
+            for first in range(0, self.questions, self.batch_size):
+                self.create_questions(user_ids, tag_ids, [start + timedelta(days=offset)
+                                                         for offset in offsets[first:first + self.batch_size]])
+            recompute_derived(Question.objects.db)
+        reset_in_process_state()
+        return self.counts
+
+    def create_users(self, joined):
+        run = '%06x' % self.rng.getrandbits(24)
+        password = make_password(SEED_PASSWORD)
+        users = [
+            User(username=f'seed-{run}-{i}', email=f'seed-{run}-{i}@example.com', password=password,
+                 created_at=joined)
+            for i in range(self.users)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        self._count('users', len(users))
+        return [user.pk for user in users]
+
+    def create_tags(self):
+        names = [f'topic-{i}' for i in range(self.tags)]
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        self._count('tags', len(names))
+        # Index 0 is the most popular tag
+        return [ids[name] for name in names]
+
+    def create_questions(self, user_ids, tag_ids, created):
+        authors, tags = self.user_dist, self.tag_dist
+        questions = [
+            Question(
+                title=self._text(6).capitalize() + '?', description=self._text(40),
+                author_id=user_ids[author], created_at=moment, updated_at=moment,
+            )
+            for author, moment in zip(authors.draw(len(created)), created)
+        ]
+        Question.objects.bulk_create(questions)
+        links = [
+            Question.tags.through(question_id=question.pk, tag_id=tag_ids[tag])
+            for question in questions
+            for tag in set(tags.draw(self.rng.randint(1, self.tags_per_question)))
+        ]
+        Question.tags.through.objects.bulk_create(links)
+        self._count('questions', len(questions))
+        self._count('question tags', len(links))
+
+        answers = []
+        for question in questions:
+            for _ in range(self._poisson_like(self.answers, 50)):
+                moment = question.created_at + timedelta(minutes=self.rng.randint(1, 60 * 24 * 7))
+                answers.append(Answer(
+                    text=self._text(30), author_id=user_ids[authors.draw()[0]], question_id=question.pk,
+                    created_at=moment,
+                ))
+        answers_by_question = {}
+        for answer in answers:
+            answers_by_question.setdefault(answer.question_id, []).append(answer)
+        completed = []
+        for question in questions:
+            candidates = answers_by_question.get(question.pk)
+            if candidates and self.rng.random() < self.accepted_ratio:
+                self.rng.choice(candidates).is_correct = True
+                question.completed = True
+                completed.append(question)
+        Answer.objects.bulk_create(answers)
+        Question.objects.bulk_update(completed, ['completed'])
+        self._count('answers', len(answers))
+        self.create_votes(user_ids, answers)
+
+    def create_votes(self, user_ids, answers):
+        likes, dislikes = [], []
+        for answer in answers:
+            count = min(self._poisson_like(self.votes, 200), len(user_ids) - 1)
+            for voter in self.rng.sample(user_ids, count):
+                if voter == answer.author_id:
+                    continue
+                if self.rng.random() < 0.8:
+                    likes.append(Likes(answer_id=answer.pk, user_id=voter))
+                else:
+                    dislikes.append(Dislikes(answer_id=answer.pk, user_id=voter))
+        Likes.objects.bulk_create(likes, batch_size=self.batch_size)
+        Dislikes.objects.bulk_create(dislikes, batch_size=self.batch_size)
+        self._count('likes', len(likes))
+        self._count('dislikes', len(dislikes))
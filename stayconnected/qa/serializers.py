@@ -1,22 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.db.models import Prefetch
 from rest_framework import serializers
+from stayconnected.fieldsets import FieldSelection, SparseFieldsMixin
 from .models import Question, Answer, Tag
+from .tags import normalize_tag_name
+from .votes import BATCH_VOTE_ACTIONS, votes_of
 
+User = get_user_model()
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
+        # Uniqueness is checked on the normalized name below
+        extra_kwargs = {'name': {'validators': []}}
+
+    def validate_name(self, value):
+        # Stored the way question creation looks tags up (see qa.tags)
+        name = normalize_tag_name(value)
+        if not name:
+            raise serializers.ValidationError('This field may not be blank.')
+        tags = Tag.objects.filter(name=name)
+        if self.instance is not None:
+            tags = tags.exclude(pk=self.instance.pk)
+        if tags.exists():
+            raise serializers.ValidationError('tag with this name already exists.')
+        return name
+
+
+class PopularTagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'question_count', 'open_count', 'completed_count']
+
+
+def wants_voters(request):
+    """``?voters=1`` adds the ids of everyone who liked/disliked each answer."""
+    return request is not None and request.query_params.get('voters') in ('1', 'true')
+
+
+def _deferred(selection, columns, keep):
+    return [column for column in columns if not selection.includes(column) and column not in keep]
+
+
+def load_my_votes(context, answers):
+    """Look up the requesting user's votes on all ``answers`` at once, unless a parent already did."""
+    if 'my_votes' not in context:
+        request = context.get('request')
+        context['my_votes'] = votes_of(request and request.user, [answer.pk for answer in answers])
+
 
+class AnswerListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        answers = list(data.all() if isinstance(data, models.Manager) else data)
+        if 'my_vote' in self.child.fields:
+            load_my_votes(self.context, answers)
+        return super().to_representation(answers)
 
-class AnswerSerializer(serializers.ModelSerializer):
+
+class AnswerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = serializers.CharField(source='author.username', read_only=True)
+    my_vote = serializers.SerializerMethodField()
+
+    expandable_fields = ('likes', 'dislikes')
 
     class Meta:
         model = Answer
-        fields = ['id', 'text', 'author', 'is_correct', 'likes', 'dislikes', 'created_at']
+        fields = ['id', 'text', 'author', 'is_correct', 'like_count', 'dislike_count', 'my_vote', 'likes', 'dislikes',
+                  'created_at']
+        read_only_fields = ['like_count', 'dislike_count']
+        list_serializer_class = AnswerListSerializer
+
+    def is_expanded(self, name):
+        return super().is_expanded(name) or wants_voters(self.context.get('request'))
+
+    def get_my_vote(self, answer):
+        return self.context.get('my_votes', {}).get(answer.pk)
+
+    @staticmethod
+    def setup_eager_loading(queryset, selection=None, keep=(), voters=False):
+        """
+        One query for the answers (with authors), without the columns that
+        ``selection`` leaves out (``keep`` names ones needed anyway, e.g. for
+        ordering). The voter lists add one query each, only when expanded
+        (or ``voters``).
+        """
+        selection = selection or FieldSelection()
+        queryset = queryset.defer(*_deferred(
+            selection, ['text', 'is_correct', 'like_count', 'dislike_count', 'created_at'], keep,
+        ))
+        if selection.includes('author'):
+            queryset = queryset.select_related('author')
+        ids = User.objects.only('id')
+        for name in AnswerSerializer.expandable_fields:
+            if voters or selection.expands(name):
+                queryset = queryset.prefetch_related(Prefetch(name, queryset=ids))
+        return queryset
+
 
+class QuestionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        questions = list(data.all() if isinstance(data, models.Manager) else data)
+        answers = self.child.fields.get('answers')
+        if answers is not None and 'my_vote' in answers.child.fields:
+            load_my_votes(self.context, [answer for question in questions for answer in question.answers.all()])
+        return super().to_representation(questions)
 
-class QuestionSerializer(serializers.ModelSerializer):
+
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = serializers.StringRelatedField()
     tags = TagSerializer(many=True)
     answers = AnswerSerializer(many=True, read_only=True)
@@ -24,20 +117,46 @@ class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = ['id', 'title', 'description', 'author', 'tags', 'answers', 'created_at', 'updated_at', 'completed']
+        list_serializer_class = QuestionListSerializer
 
-    def get_tags(self, obj):
-        return TagSerializer(obj.tags.all(), many=True).data
-
-    def get_answers(self, obj):
-        return AnswerSerializer(
-            obj.answers.select_related('author'),  # Limit to 5 answers, prefetch author
-            many=True
-        ).data
+    @staticmethod
+    def setup_eager_loading(queryset, selection=None, keep=(), voters=False):
+        """
+        Load everything the serializer touches in a fixed number of queries:
+        one for the questions (with authors), then one each for tags and
+        answers (with authors), however many rows are on the page. The
+        viewer's votes take one more, and the voter lists two. Whatever
+        ``selection`` leaves out is neither loaded nor prefetched; ``keep``
+        names columns needed anyway, e.g. for ordering.
+        """
+        selection = selection or FieldSelection()
+        queryset = queryset.defer('search_vector', *_deferred(
+            selection, ['title', 'description', 'created_at', 'updated_at', 'completed'], keep,
+        ))
+        if selection.includes('author'):
+            queryset = queryset.select_related('author')
+        if selection.includes('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if selection.includes('answers'):
+            answers = AnswerSerializer.setup_eager_loading(
+                Answer.objects.order_by('created_at', 'id'), selection.child('answers'), voters=voters,
+            )
+            queryset = queryset.prefetch_related(Prefetch('answers', queryset=answers))
+        return queryset
 
 
 class CreateQuestionSerializer(serializers.ModelSerializer):
-    tags = serializers.ListField(child=serializers.CharField(), write_only=True)
+    tags = serializers.ListField(child=serializers.CharField(max_length=50), write_only=True)
 
     class Meta:
         model = Question
         fields = ['title', 'description', 'tags']
+
+
+class VoteSerializer(serializers.Serializer):
+    answer_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=BATCH_VOTE_ACTIONS)
+
+
+class BatchVoteSerializer(serializers.Serializer):
+    votes = serializers.ListField(child=VoteSerializer(), allow_empty=False, max_length=500)
@@ -1,9 +1,270 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from qa.models import Answer
+from qa.models import Answer, Question, Tag, User
+from qa.search import get_search_backend
+from qa.tag_index import tag_index
+from qa.tasks import check_completion, index_question
+from qa.tags import apply_tag_count_deltas, count_links, tag_resolver
+from qa.trending import ANSWER_WEIGHT, LIKE_WEIGHT, QUESTION_WEIGHT, add_activity, event_score
+from qa.votes import Dislikes, Likes, apply_vote_deltas, votes_changed
+from stayconnected.caching import invalidate, question_namespace
+
+SEARCH_FIELDS = {'title', 'description'}
 
 
 @receiver(post_save, sender=Answer)
 def update_question_completion(sender, instance, **kwargs):
     if instance.is_correct:
-        instance.question.check_completion()
+        check_completion.enqueue(instance.question_id, dedupe_key=f'qa.check_completion:{instance.question_id}')
+
+
+@receiver(post_save, sender=Question)
+def update_question_search_index(sender, instance, created, update_fields, using, **kwargs):
+    if created or update_fields is None or SEARCH_FIELDS & set(update_fields):
+        index_question.enqueue(instance.pk, using, dedupe_key=f'qa.index_question:{using}:{instance.pk}')
+
+
+@receiver(post_delete, sender=Question)
+def remove_question_search_index(sender, instance, using, **kwargs):
+    get_search_backend(using).remove([instance.pk])
+
+
+def _update_tag_index(update, name, question_ids, using):
+    # Only once committed, so a rolled back write leaves no ids behind
+    question_ids = list(question_ids)
+    transaction.on_commit(lambda: update(name, question_ids), using=using)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def update_tag_index(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not tag_index.loaded:
+        return
+    if action == 'pre_clear':
+        if reverse:
+            instance._tag_index_cleared = [(instance.name, list(instance.questions.values_list('id', flat=True)))]
+        else:
+            instance._tag_index_cleared = [(name, [instance.pk]) for name in instance.tags.values_list('name', flat=True)]
+    elif action == 'post_clear':
+        for name, question_ids in getattr(instance, '_tag_index_cleared', []):
+            _update_tag_index(tag_index.discard, name, question_ids, using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        update = tag_index.add if action == 'post_add' else tag_index.discard
+        if reverse:
+            _update_tag_index(update, instance.name, pk_set, using)
+        else:
+            for name in Tag.objects.filter(id__in=pk_set).values_list('name', flat=True):
+                _update_tag_index(update, name, [instance.pk], using)
+
+
+@receiver(pre_delete, sender=Question)
+def stash_question_tags(sender, instance, **kwargs):
+    if tag_index.loaded:
+        instance._tag_index_names = list(instance.tags.values_list('name', flat=True))
+
+
+@receiver(post_delete, sender=Question)
+def remove_question_from_tag_index(sender, instance, using, **kwargs):
+    for name in getattr(instance, '_tag_index_names', []):
+        _update_tag_index(tag_index.discard, name, [instance.pk], using)
+
+
+@receiver(pre_delete, sender=Tag)
+def stash_tag_questions(sender, instance, **kwargs):
+    if tag_index.loaded:
+        instance._tag_index_question_ids = list(instance.questions.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def remove_tag_from_tag_index(sender, instance, using, **kwargs):
+    _update_tag_index(tag_index.discard, instance.name, getattr(instance, '_tag_index_question_ids', []), using)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() reports whatever it was asked to remove; count the links that exist
+        links = sender.objects.filter(**{'tag_id' if reverse else 'question_id': instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{'question_id__in' if reverse else 'tag_id__in': pk_set})
+        instance._tag_count_links = list(links.values_list('tag_id', 'question__completed'))
+    elif action == 'post_add' and pk_set:
+        if reverse:
+            completed = Question.objects.filter(id__in=pk_set, completed=True).count()
+            apply_tag_count_deltas({instance.pk: (len(pk_set), completed)})
+        else:
+            apply_tag_count_deltas(count_links((tag_id, instance.completed) for tag_id in pk_set))
+    elif action in ('post_remove', 'post_clear'):
+        apply_tag_count_deltas(count_links(getattr(instance, '_tag_count_links', []), sign=-1))
+
+
+@receiver(pre_delete, sender=Question)
+def discount_deleted_question_tags(sender, instance, **kwargs):
+    # The through rows go with the question without m2m signals
+    links = Question.tags.through.objects.filter(question_id=instance.pk)
+    apply_tag_count_deltas(count_links(links.values_list('tag_id', 'question__completed'), sign=-1))
+
+
+@receiver(pre_save, sender=Question)
+def stash_question_completed(sender, instance, update_fields, **kwargs):
+    if instance.pk and (update_fields is None or 'completed' in update_fields):
+        instance._completed_before = Question.objects.filter(pk=instance.pk).values_list('completed', flat=True).first()
+
+
+@receiver(post_save, sender=Question)
+def update_tag_completed_counts(sender, instance, **kwargs):
+    before = getattr(instance, '_completed_before', None)
+    instance._completed_before = None
+    if before is not None and before != instance.completed:
+        tag_ids = Question.tags.through.objects.filter(question_id=instance.pk).values_list('tag_id', flat=True)
+        apply_tag_count_deltas({tag_id: (0, 1 if instance.completed else -1) for tag_id in tag_ids})
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def forget_resolved_tags(sender, instance, created=False, **kwargs):
+    # A rename or delete can leave stale name -> id entries behind
+    if not created:
+        tag_resolver.clear()
+
+
+def _track_vote_change(through, instance, action, reverse, pk_set):
+    """
+    Turn likes/dislikes add()/remove()/clear() calls into exact counter deltas.
+    post_add's pk_set only holds rows that were really inserted, but remove()
+    reports whatever it was asked to remove, so the rows that exist are looked
+    up in pre_remove/pre_clear.
+    """
+    key = 'answer_id' if not reverse else 'user_id'
+    other = 'user_id' if not reverse else 'answer_id'
+    stash = f'_pending_{through._meta.db_table}'
+
+    if action in ('pre_remove', 'pre_clear'):
+        rows = through.objects.filter(**{key: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{f'{other}__in': pk_set})
+        setattr(instance, stash, list(rows.values_list('answer_id', flat=True)))
+        return
+    if action == 'post_add':
+        answer_ids, sign = ([instance.pk] * len(pk_set) if not reverse else pk_set), 1
+    elif action in ('post_remove', 'post_clear'):
+        answer_ids, sign = getattr(instance, stash, []), -1
+    else:
+        return
+
+    deltas = {}
+    for answer_id in answer_ids:
+        likes, dislikes = deltas.get(answer_id, (0, 0))
+        if through is Likes:
+            deltas[answer_id] = (likes + sign, dislikes)
+        else:
+            deltas[answer_id] = (likes, dislikes + sign)
+    answers = {instance.pk: (instance.author_id, instance.question_id)} if not reverse else None
+    apply_vote_deltas(deltas, answers=answers)
+
+
+@receiver(m2m_changed, sender=Likes)
+def update_answer_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    _track_vote_change(Likes, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Dislikes)
+def update_answer_dislike_count(sender, instance, action, reverse, pk_set, **kwargs):
+    _track_vote_change(Dislikes, instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=Answer)
+def discount_deleted_answer_votes(sender, instance, **kwargs):
+    # The through rows go with the answer without m2m signals, so take its
+    # votes off the author here. The instance's counters may be stale.
+    counts = Answer.objects.filter(pk=instance.pk).values_list('like_count', 'dislike_count').first()
+    if counts and any(counts):
+        votes_changed.send(
+            sender=Answer,
+            author_deltas={instance.author_id: (-counts[0], -counts[1])},
+            question_ids={instance.question_id},
+        )
+
+
+@receiver(pre_delete, sender=User)
+def discount_deleted_voter_votes(sender, instance, **kwargs):
+    deltas = {}
+    for answer_id in Likes.objects.filter(user_id=instance.pk).values_list('answer_id', flat=True):
+        deltas[answer_id] = (-1, 0)
+    for answer_id in Dislikes.objects.filter(user_id=instance.pk).values_list('answer_id', flat=True):
+        deltas[answer_id] = (deltas.get(answer_id, (0, 0))[0], -1)
+    apply_vote_deltas(deltas)
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def touch_answered_question(sender, instance, **kwargs):
+    Question.touch([instance.question_id])
+
+
+@receiver(pre_save, sender=Question)
+def score_new_question(sender, instance, raw, **kwargs):
+    if instance._state.adding and not raw:
+        instance.trending_score = event_score(QUESTION_WEIGHT)
+
+
+@receiver(post_save, sender=Answer)
+def score_answered_question(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        add_activity({instance.question_id: ANSWER_WEIGHT})
+
+
+@receiver(votes_changed, sender=Answer)
+def score_liked_questions(sender, liked_questions=None, **kwargs):
+    if liked_questions:
+        add_activity({question_id: likes * LIKE_WEIGHT for question_id, likes in liked_questions.items()})
+
+
+@receiver(votes_changed, sender=Answer)
+def touch_voted_questions(sender, question_ids, **kwargs):
+    Question.touch(question_ids)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def touch_tagged_questions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Question.touch([instance.pk])
+    elif action == 'pre_clear':
+        Question.touch(instance.questions.values('id'))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        Question.touch(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def touch_untagged_questions(sender, instance, **kwargs):
+    Question.touch(instance.questions.values('id'))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_responses(sender, instance, **kwargs):
+    invalidate('questions', question_namespace(instance.pk))
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def invalidate_answer_responses(sender, instance, **kwargs):
+    invalidate('questions', question_namespace(instance.question_id))
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def invalidate_question_tag_responses(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate('questions')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+    invalidate('tags', 'questions')
+
+
+@receiver(votes_changed, sender=Answer)
+def invalidate_vote_responses(sender, question_ids, **kwargs):
+    invalidate('questions', *[question_namespace(question_id) for question_id in question_ids])
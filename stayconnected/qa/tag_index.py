@@ -0,0 +1,326 @@
+"""
+In-process tag -> question-id bitmap index.
+
+Bitmaps are split Roaring-style into 2**16-wide containers: a container with
+few ids is a sorted ``array('H')`` of the low 16 bits, a busy one is a Python
+int used as a 65536-bit set. That keeps rare tags tiny while popular tags get
+C-speed ``&``/``|``. Filtering by any/all of several tags is then pure set
+algebra, and the database is only asked for the page of ids being returned.
+
+Bitmaps are never changed in place: an update builds a new bitmap and swaps
+it in, so a request keeps paging through the snapshot it started with.
+
+The index is built when a server process starts (see ``warm_up``, called from
+stayconnected.wsgi/asgi; other processes build it on first use), updated
+incrementally from signals once the writing transaction commits (see
+qa.signals) and rebuilt in the background once it is older than
+``QA_TAG_INDEX_MAX_AGE`` seconds, which bounds how long other worker
+processes can lag behind writes made in this one.
+"""
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .models import Question
+from .tags import normalize_tag_name
+
+CONTAINER_BITS = 16
+LOW_MASK = (1 << CONTAINER_BITS) - 1
+ARRAY_MAX = 4096
+
+logger = logging.getLogger(__name__)
+
+
+def _to_dense(container):
+    if isinstance(container, int):
+        return container
+    dense = 0
+    for low in container:
+        dense |= 1 << low
+    return dense
+
+
+def _to_container(dense):
+    if dense.bit_count() > ARRAY_MAX:
+        return dense
+    values = array('H')
+    while dense:
+        low = (dense & -dense).bit_length() - 1
+        values.append(low)
+        dense &= dense - 1
+    return values
+
+
+def _union(a, b):
+    if isinstance(a, int) or isinstance(b, int) or len(a) + len(b) > ARRAY_MAX:
+        return _to_container(_to_dense(a) | _to_dense(b))
+    return array('H', sorted(set(a).union(b)))
+
+
+def _intersection(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _to_container(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        bits = b.to_bytes((LOW_MASK + 1) // 8, 'little')
+        return array('H', (low for low in a if bits[low >> 3] >> (low & 7) & 1))
+    return array('H', sorted(set(a).intersection(b)))
+
+
+def _difference(a, b):
+    if isinstance(a, int):
+        return _to_container(a & ~_to_dense(b))
+    if isinstance(b, int):
+        bits = b.to_bytes((LOW_MASK + 1) // 8, 'little')
+        return array('H', (low for low in a if not bits[low >> 3] >> (low & 7) & 1))
+    return array('H', sorted(set(a).difference(b)))
+
+
+def _cardinality(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _iter_desc(container, below=None):
+    if isinstance(container, int):
+        if below is not None:
+            container &= (1 << below) - 1
+        while container:
+            low = container.bit_length() - 1
+            yield low
+            container ^= 1 << low
+    else:
+        end = len(container) if below is None else bisect_left(container, below)
+        for index in range(end - 1, -1, -1):
+            yield container[index]
+
+
+class Bitmap:
+    """A compressed set of non-negative integers."""
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        buckets = {}
+        for value in ids:
+            buckets.setdefault(value >> CONTAINER_BITS, set()).add(value & LOW_MASK)
+        containers = {}
+        for high, lows in buckets.items():
+            if len(lows) > ARRAY_MAX:
+                dense = bytearray((LOW_MASK + 1) // 8)
+                for low in lows:
+                    dense[low >> 3] |= 1 << (low & 7)
+                containers[high] = int.from_bytes(dense, 'little')
+            else:
+                containers[high] = array('H', sorted(lows))
+        return cls(containers)
+
+    def __contains__(self, value):
+        container = self.containers.get(value >> CONTAINER_BITS)
+        if container is None:
+            return False
+        low = value & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            containers[high] = _union(containers[high], container) if high in containers else container
+        return Bitmap(containers)
+
+    def __sub__(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            if high in containers:
+                container = _difference(containers[high], container)
+                if _cardinality(container):
+                    containers[high] = container
+                else:
+                    del containers[high]
+        return Bitmap(containers)
+
+    def __and__(self, other):
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            container = _intersection(self.containers[high], other.containers[high])
+            if _cardinality(container):
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def iter_desc(self, below=None):
+        """Yield members in descending order, optionally only those ``< below``."""
+        for high in sorted(self.containers, reverse=True):
+            base = high << CONTAINER_BITS
+            if below is not None:
+                if base >= below:
+                    continue
+                limit = below - base if below - base <= LOW_MASK else None
+            else:
+                limit = None
+            for low in _iter_desc(self.containers[high], limit):
+                yield base | low
+
+    def top(self, count, below=None, offset=0):
+        ids = []
+        for value in self.iter_desc(below):
+            if offset:
+                offset -= 1
+                continue
+            if len(ids) == count:
+                break
+            ids.append(value)
+        return ids
+
+
+class TagBitmapIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bitmaps = None
+        self._built_at = 0.0
+        self._rebuilding = False
+        # One list per rebuild in progress, collecting the updates it may have missed
+        self._missed = []
+
+    normalize = staticmethod(normalize_tag_name)
+
+    def _load(self):
+        ids_by_tag = {}
+        rows = Question.tags.through.objects.values_list('tag__name', 'question_id')
+        for name, question_id in rows.iterator(chunk_size=10000):
+            ids_by_tag.setdefault(self.normalize(name), []).append(question_id)
+        return {name: Bitmap.from_ids(ids) for name, ids in ids_by_tag.items()}
+
+    def rebuild(self):
+        # Updates committed after _load read its snapshot would be lost when
+        # the result is swapped in, so they are recorded and replayed on top
+        missed = []
+        with self._lock:
+            self._missed.append(missed)
+        try:
+            bitmaps = self._load()
+        except BaseException:
+            with self._lock:
+                self._missed.remove(missed)
+            raise
+        with self._lock:
+            self._missed.remove(missed)
+            for update in missed:
+                self._apply(bitmaps, *update)
+            self._bitmaps = bitmaps
+            self._built_at = time.monotonic()
+
+    def warm_up(self):
+        """Build the index before the first request; closes the connection used so forked workers don't share it."""
+        try:
+            self.rebuild()
+        except DatabaseError:
+            logger.exception('Could not build the tag index at startup, building it on first use')
+        finally:
+            connections.close_all()
+
+    @property
+    def loaded(self):
+        return self._bitmaps is not None
+
+    def reset(self):
+        with self._lock:
+            self._bitmaps = None
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+    def _get_bitmaps(self):
+        with self._lock:
+            if self._bitmaps is None:
+                self.rebuild()
+            elif not self._rebuilding and time.monotonic() - self._built_at > settings.QA_TAG_INDEX_MAX_AGE:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+            return self._bitmaps
+
+    def get(self, name):
+        return self._get_bitmaps().get(self.normalize(name), Bitmap())
+
+    def any_of(self, names):
+        result = Bitmap()
+        for name in names:
+            result = result | self.get(name)
+        return result
+
+    def all_of(self, names):
+        bitmaps = sorted((self.get(name) for name in names), key=len)
+        if not bitmaps:
+            return Bitmap()
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap
+        return result
+
+    def _apply(self, bitmaps, name, question_ids, remove):
+        # Copy on write: readers keep the bitmap they already got
+        name = self.normalize(name)
+        if remove:
+            if name in bitmaps:
+                bitmaps[name] = bitmaps[name] - Bitmap.from_ids(question_ids)
+        else:
+            bitmaps[name] = bitmaps.get(name, Bitmap()) | Bitmap.from_ids(question_ids)
+
+    def _update(self, name, question_ids, remove):
+        with self._lock:
+            for missed in self._missed:
+                missed.append((name, question_ids, remove))
+            if self._bitmaps is not None:
+                self._apply(self._bitmaps, name, question_ids, remove)
+
+    def add(self, name, question_ids):
+        self._update(name, question_ids, remove=False)
+
+    def discard(self, name, question_ids):
+        self._update(name, question_ids, remove=True)
+
+
+class BitmapResults:
+    """
+    Paginator-compatible view of a bitmap, newest (highest id) first:
+    ``count()`` is the bitmap cardinality and slicing loads only that slice.
+    """
+
+    def __init__(self, bitmap, queryset):
+        self.bitmap = bitmap
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.bitmap)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        ids = self.bitmap.top(item.stop - offset, offset=offset) if item.stop is not None else \
+            list(self.bitmap.iter_desc())[offset:]
+        rows = self.queryset.in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+tag_index = TagBitmapIndex()
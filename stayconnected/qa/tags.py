@@ -0,0 +1,156 @@
+"""
+Tag lookup by name for question creation, and the per-tag question counters.
+
+Names are normalized (trimmed, lower-cased) and resolved to ids in bulk: one
+``name__in`` query for the ones not in the in-process LRU, and one
+``bulk_create(ignore_conflicts=True)`` plus a re-read for the ones that do not
+exist yet, which also settles races with concurrent creators. Deleting a tag
+evicts it here (see qa.signals); other processes only drop it once it falls
+out of their LRU, which is acceptable because tags are effectively never
+deleted outside the admin.
+
+Every tag write (``TagSerializer``, the NDJSON import) stores normalized
+names too, so the exact ``name`` lookups here and in the views are enough.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+
+from stayconnected.caching import invalidate
+from .models import Question, Tag
+
+
+def normalize_tag_name(name):
+    return name.strip().lower()
+
+
+class TagResolver:
+    def __init__(self, size=None):
+        self._size = size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size if self._size is not None else settings.QA_TAG_CACHE_SIZE
+
+    def _remember(self, ids):
+        with self._lock:
+            for name, tag_id in ids.items():
+                self._ids[name] = tag_id
+                self._ids.move_to_end(name)
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+
+    def forget(self, name):
+        with self._lock:
+            self._ids.pop(normalize_tag_name(name), None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def resolve(self, names):
+        """
+        Return ``{normalized name: tag id}`` for ``names`` in first-seen order,
+        creating the tags that do not exist.
+        """
+        names = list(dict.fromkeys(filter(None, map(normalize_tag_name, names))))
+        found = {}
+        with self._lock:
+            for name in names:
+                if name in self._ids:
+                    found[name] = self._ids[name]
+                    self._ids.move_to_end(name)
+
+        missing = [name for name in names if name not in found]
+        if missing:
+            fetched = dict(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+            to_create = [name for name in missing if name not in fetched]
+            if to_create:
+                Tag.objects.bulk_create([Tag(name=name) for name in to_create], ignore_conflicts=True)
+                # ignore_conflicts leaves ids unset, and another request may have won the race
+                fetched.update(Tag.objects.filter(name__in=to_create).values_list('name', 'id'))
+                # bulk_create sends no post_save, so the tag list isn't invalidated by qa.signals
+                # (invalidate() waits for the commit)
+                invalidate('tags', 'questions')
+            self._remember(fetched)
+            found.update(fetched)
+        return {name: found[name] for name in names}
+
+
+def attach_tags(question, tag_ids):
+    """
+    Add tags to a new question with a single through-table insert, skipping
+    the existing-row lookup of ``tags.add()``. m2m_changed is still sent so
+    the tag index, counters and caches stay in sync; since it reports every id
+    as added, use ``tags.add()`` for questions that may already have some.
+    """
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+    through = Question.tags.through
+    signal_kwargs = dict(sender=through, instance=question, reverse=False, model=Tag, pk_set=tag_ids,
+                         using=question._state.db)
+    m2m_changed.send(action='pre_add', **signal_kwargs)
+    through.objects.using(question._state.db).bulk_create(
+        [through(question_id=question.pk, tag_id=tag_id) for tag_id in tag_ids],
+        ignore_conflicts=True,
+    )
+    m2m_changed.send(action='post_add', **signal_kwargs)
+
+
+def apply_tag_count_deltas(deltas):
+    """
+    ``deltas`` maps tag id -> (questions, completed questions). Tags that move
+    by the same amounts share one UPDATE.
+    """
+    tag_ids_by_delta = {}
+    for tag_id, delta in deltas.items():
+        if any(delta):
+            tag_ids_by_delta.setdefault(delta, []).append(tag_id)
+    for (questions, completed), tag_ids in tag_ids_by_delta.items():
+        Tag.objects.filter(id__in=tag_ids).update(
+            question_count=F('question_count') + questions,
+            completed_count=F('completed_count') + completed,
+        )
+    if tag_ids_by_delta:
+        invalidate('tag-counts')
+
+
+def count_links(links, sign=1):
+    """Turn (tag id, question completed) pairs into apply_tag_count_deltas() input."""
+    deltas = {}
+    for tag_id, completed in links:
+        questions, completed_questions = deltas.get(tag_id, (0, 0))
+        deltas[tag_id] = (questions + sign, completed_questions + sign * int(completed))
+    return deltas
+
+
+def _question_count(**filters):
+    return Coalesce(
+        Subquery(
+            Question.tags.through.objects.filter(tag_id=OuterRef('pk'), **filters)
+            .values('tag_id')
+            .annotate(total=Count('*'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile_tag_counts(using=None):
+    """Recompute every tag's counters from the through table."""
+    tags = Tag.objects.using(using) if using else Tag.objects.all()
+    tags.update(
+        question_count=_question_count(),
+        completed_count=_question_count(question__completed=True),
+    )
+    invalidate('tag-counts')
+
+
+tag_resolver = TagResolver()
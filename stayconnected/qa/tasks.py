@@ -0,0 +1,25 @@
+from django.conf import settings
+
+from tasks.queue import task
+from .models import Question
+from .search import get_search_backend
+from .votes import flush_vote_deltas
+
+
+@task('qa.check_completion')
+def check_completion(question_id):
+    question = Question.objects.filter(pk=question_id).first()
+    if question is not None:
+        question.check_completion()
+
+
+@task('qa.index_question')
+def index_question(question_id, using=None):
+    get_search_backend(using).index([question_id])
+
+
+@task('qa.flush_votes')
+def flush_votes():
+    # A full batch means more are waiting; keep going in a fresh task
+    if flush_vote_deltas() == settings.VOTES_FLUSH_BATCH:
+        flush_votes.enqueue(dedupe_key='qa.flush_votes')
@@ -1,3 +1,793 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+from unittest import skipUnless
 
-# Create your tests here.
+import msgpack
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from stayconnected import benchmark, compression
+from stayconnected.caching import check_shared_cache
+from stayconnected.metrics import registry
+from tasks.models import Task
+from tasks.queue import claim, run
+from user.models import User
+from user.tokens import UserRefreshToken
+from .models import Answer, Question, Tag, VoteDelta
+from .search import get_search_backend
+from .seeding import Seeder
+from .tag_index import tag_index
+from .tags import reconcile_tag_counts, tag_resolver
+from .trending import recompute_trending
+from .votes import apply_vote_deltas, cast_vote, flush_vote_deltas, reconcile_vote_counts, votes_changed
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', email='asker@example.com', password='password')
+        self.other = User.objects.create_user(username='helper', email='helper@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tag_index.reset()
+        tag_resolver.clear()
+        cache.clear()
+
+    def ask(self, tags, **kwargs):
+        data = {'title': 'How?', 'description': 'Details', 'tags': tags, **kwargs}
+        response = self.client.post('/api/questions/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+
+class QuestionFeedTests(APITestCase):
+    def test_pages_are_disjoint_and_newest_first(self):
+        django, python = Tag.objects.create(name='django'), Tag.objects.create(name='python')
+        for i in range(25):
+            question = Question.objects.create(title=f'q{i}', description='d', author=self.other)
+            question.tags.add(django, python)
+
+        seen, url = [], '/api/questions/?tags=django&tags=PYTHON'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [question['id'] for question in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/questions/?cursor=garbage').status_code, 404)
+
+    def test_tag_match_all_follows_changes(self):
+        a, b = Tag.objects.create(name='a'), Tag.objects.create(name='b')
+        questions = [Question.objects.create(title=f't{i}', description='d', author=self.user) for i in range(12)]
+        for i, question in enumerate(questions):
+            if i % 2 == 0:
+                question.tags.add(a)
+            if i % 3 == 0:
+                question.tags.add(b)
+
+        url = '/api/questions/?tags=a&tags=b&tag_match=all'
+        self.assertEqual([q['id'] for q in self.client.get(url).data['results']], [questions[6].id, questions[0].id])
+        self.assertTrue(tag_index.loaded)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            questions[1].tags.add(a, b)
+            questions[0].tags.clear()
+        self.assertEqual([q['id'] for q in self.client.get(url).data['results']], [questions[6].id, questions[1].id])
+
+    def test_rolled_back_tags_stay_out_of_the_index(self):
+        django = Tag.objects.create(name='django')
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        self.assertEqual(len(tag_index.get('django')), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    question.tags.add(django)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(len(tag_index.get('django')), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.tags.add(django)
+        self.assertEqual(list(tag_index.get('django').iter_desc()), [question.id])
+
+    def test_pages_continue_past_rows_missing_from_the_database(self):
+        django = Tag.objects.create(name='django')
+        questions = [Question.objects.create(title=f'q{i}', description='d', author=self.other) for i in range(5)]
+        for question in questions:
+            question.tags.add(django)
+        tag_index.rebuild()
+        # Not committed, so like a delete made by another process the index still has the ids
+        Question.objects.filter(id__in=[q.id for q in questions[1:4]]).delete()
+
+        response = self.client.get('/api/questions/?tags=django&page_size=1')
+        self.assertEqual([q['id'] for q in response.data['results']], [questions[4].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([q['id'] for q in response.data['results']], [questions[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_updates_during_a_rebuild_are_kept(self):
+        django = Tag.objects.create(name='django')
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        tag_index.rebuild()
+        load = tag_index._load
+
+        def load_then_commit():
+            bitmaps = load()
+            # Committed after the snapshot was read
+            with self.captureOnCommitCallbacks(execute=True):
+                question.tags.add(django)
+            return bitmaps
+        tag_index._load = load_then_commit
+        self.addCleanup(vars(tag_index).pop, '_load')
+
+        tag_index.rebuild()
+        self.assertEqual(list(tag_index.get('django').iter_desc()), [question.id])
+
+    def test_pages_follow_ids_where_created_at_disagrees(self):
+        django = Tag.objects.create(name='django')
+        questions = [Question.objects.create(title=f'q{i}', description='d', author=self.other) for i in range(5)]
+        for question in questions:
+            question.tags.add(django)
+        Question.objects.filter(id=questions[4].id).update(created_at=questions[0].created_at - timedelta(days=1))
+
+        seen, url = [], '/api/questions/?tags=django&page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [question['id'] for question in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [question.id for question in reversed(questions)])
+
+    def test_updates_do_not_change_bitmaps_already_handed_out(self):
+        tag_index.rebuild()
+        tag_index.add('django', [1, 2])
+        snapshot = tag_index.get('django')
+        tag_index.add('django', [3])
+        tag_index.discard('django', [1])
+        self.assertEqual(list(snapshot.iter_desc()), [2, 1])
+        self.assertEqual(list(tag_index.get('django').iter_desc()), [3, 2])
+
+
+class SearchTests(APITestCase):
+    def test_ranked_search_with_tag_filter(self):
+        tag = Tag.objects.create(name='django')
+        for i in range(6):
+            question = Question.objects.create(
+                title=f'Running migrations {i}', description='How do I run django migrations on deploy?',
+                author=self.user,
+            )
+            if i % 2:
+                question.tags.add(tag)
+        Question.objects.create(title='Unrelated', description='cats', author=self.user)
+
+        self.assertEqual(self.client.get('/api/questions/search/?query=migration').data['count'], 6)
+        self.assertEqual(self.client.get('/api/questions/search/?query=migrations&tag=django').data['count'], 3)
+        self.assertEqual(self.client.get('/api/questions/search/?tag=django').data['count'], 3)
+        self.assertEqual(self.client.get('/api/questions/search/?query=%22%28*').data['count'], 0)
+
+
+class VoteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        question = Question.objects.create(title='t', description='d', author=self.other)
+        self.answer = Answer.objects.create(text='a', author=self.other, question=question)
+
+    def counts(self):
+        self.answer.refresh_from_db()
+        self.other.refresh_from_db()
+        return (self.answer.like_count, self.answer.dislike_count, self.other.like_count, self.other.dislike_count)
+
+    def test_like_then_dislike(self):
+        url = f'/api/answers/{self.answer.id}/'
+        self.client.post(url + 'like/')
+        self.client.post(url + 'like/')
+        self.assertEqual(self.counts(), (1, 0, 1, 0))
+        self.client.post(url + 'dislike/')
+        self.assertEqual(self.counts(), (0, 1, 0, 1))
+        self.assertEqual(self.client.post(url + 'meh/').status_code, 400)
+
+    def test_m2m_changes_keep_counters(self):
+        self.answer.likes.add(self.other, self.user)
+        self.answer.dislikes.add(self.user)
+        self.assertEqual(self.counts(), (2, 1, 2, 1))
+        self.user.liked_answers.clear()
+        self.assertEqual(self.counts(), (1, 1, 1, 1))
+        self.user.delete()
+        self.assertEqual(self.counts(), (1, 0, 1, 0))
+
+    def test_reconcile(self):
+        self.answer.likes.add(self.user)
+        Answer.objects.filter(id=self.answer.id).update(like_count=7)
+        self.assertEqual(reconcile_vote_counts(), 1)
+        self.assertEqual(self.counts(), (1, 0, 1, 0))
+
+    def test_batch(self):
+        answers = [Answer.objects.create(text='a', author=self.other, question=self.answer.question) for _ in range(3)]
+        votes = [{'answer_id': answer.id, 'action': 'like'} for answer in answers]
+        votes += [{'answer_id': answers[1].id, 'action': 'dislike'}, {'answer_id': 9999, 'action': 'like'}]
+        response = self.client.post('/api/answers/votes/', {'votes': votes}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['not_found'], [9999])
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.like_count, self.other.dislike_count, self.other.reputation), (2, 1, 15))
+
+        response = self.client.post('/api/answers/votes/', {'votes': [{'answer_id': 1, 'action': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(VOTES_WRITE_BEHIND=True, TASKS_EAGER=False)
+    def test_write_behind(self):
+        url = f'/api/answers/{self.answer.id}/'
+        self.client.post(url + 'like/')
+        self.client.post(url + 'dislike/')
+        self.client.post(url + 'dislike/')
+        self.assertEqual(self.counts(), (0, 0, 0, 0))
+        self.assertEqual(VoteDelta.objects.count(), 2)
+        self.assertEqual(Task.objects.filter(name='qa.flush_votes').count(), 1)
+
+        with override_settings(TASKS_EAGER=True):
+            self.assertEqual(flush_vote_deltas(), 2)
+        self.assertEqual(self.counts(), (0, 1, 0, 1))
+        self.assertFalse(VoteDelta.objects.exists())
+
+        # Reconciling counts the staged votes from the through tables and drops them
+        self.client.post(url + 'like/')
+        self.assertEqual(reconcile_vote_counts(), 1)
+        self.assertFalse(VoteDelta.objects.exists())
+        self.assertEqual(self.counts()[:2], (1, 0))
+
+
+class TrendingTests(APITestCase):
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [question['id'] for question in response.data['results']], response.data['next']
+
+    def test_activity_raises_questions(self):
+        quiet = self.ask(['django'])
+        busy = self.ask(['python'])
+        newest = self.ask(['django'])
+        self.assertEqual(self.ids('/api/questions/trending/')[0], [newest, busy, quiet])
+
+        answer = Answer.objects.create(text='a', author=self.other, question_id=busy)
+        cast_vote(answer, self.user, 'like')
+        cache.clear()
+        self.assertEqual(self.ids('/api/questions/trending/')[0], [busy, newest, quiet])
+        self.assertEqual(self.ids('/api/questions/trending/?tags=Django')[0], [newest, quiet])
+
+        ids, next_url = self.ids('/api/questions/trending/?page_size=2')
+        self.assertEqual(ids, [busy, newest])
+        self.assertEqual(self.ids(next_url), ([quiet], None))
+
+        # A rebuild orders them the same way
+        recompute_trending()
+        scores = dict(Question.objects.values_list('id', 'trending_score'))
+        self.assertGreater(scores[busy], scores[newest])
+        self.assertGreater(scores[newest], scores[quiet])
+        recompute_trending(batch_size=1)
+        for pk, score in Question.objects.values_list('id', 'trending_score'):
+            self.assertAlmostEqual(score, scores[pk])
+
+    def test_tag_filter_matches_tags_created_in_mixed_case(self):
+        self.client.post('/api/tags/', {'name': 'GraphQL'}, format='json')
+        question = self.ask(['graphql'])
+        self.ask(['rest'])
+        self.assertEqual(self.ids('/api/questions/trending/?tags=GraphQL')[0], [question])
+
+
+class AnswerListTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.question = Question.objects.create(title='t', description='d', author=self.user)
+        self.url = f'/api/questions/{self.question.id}/list-answers/'
+
+    def answer(self, likes=0, dislikes=0, correct=False):
+        answer = Answer.objects.create(text='a', author=self.other, question=self.question, is_correct=correct)
+        voters = [User.objects.create_user(username=f'voter{n}', email=f'voter{n}@example.com', password='password')
+                  for n in range(User.objects.count(), User.objects.count() + likes + dislikes)]
+        for voter in voters[:likes]:
+            cast_vote(answer, voter, 'like')
+        for voter in voters[likes:]:
+            cast_vote(answer, voter, 'dislike')
+        return answer.id
+
+    def ids(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [answer['id'] for answer in response.data['results']], response.data['next']
+
+    def test_sort_modes(self):
+        plain = self.answer()
+        liked = self.answer(likes=2)
+        disliked = self.answer(dislikes=1)
+        accepted = self.answer(correct=True)
+        mixed = self.answer(likes=2, dislikes=1)
+
+        self.assertEqual(self.ids(self.url)[0], [accepted, liked, mixed, plain, disliked])
+        self.assertEqual(self.ids(self.url + '?sort=oldest')[0], [plain, liked, disliked, accepted, mixed])
+        self.assertEqual(self.ids(self.url + '?sort=newest')[0], [mixed, accepted, disliked, liked, plain])
+
+        ids, next_url = self.ids(self.url + '?page_size=3')
+        self.assertEqual(ids, [accepted, liked, mixed])
+        self.assertEqual(self.ids(next_url), ([plain, disliked], None))
+        self.assertEqual(self.client.get(self.url + '?sort=best').status_code, 400)
+
+    def test_vote_state(self):
+        liked = Answer.objects.get(id=self.answer(likes=2))
+        disliked = Answer.objects.get(id=self.answer(dislikes=1))
+        cast_vote(liked, self.user, 'like')
+        cast_vote(disliked, self.user, 'dislike')
+
+        results = {answer['id']: answer for answer in self.client.get(self.url).data['results']}
+        self.assertEqual(
+            (results[liked.id]['like_count'], results[liked.id]['dislike_count'], results[liked.id]['my_vote']),
+            (3, 0, 'like'),
+        )
+        self.assertEqual(results[disliked.id]['my_vote'], 'dislike')
+        self.assertNotIn('likes', results[liked.id])
+
+        results = {answer['id']: answer for answer in self.client.get(self.url + '?voters=1').data['results']}
+        self.assertEqual(len(results[liked.id]['likes']), 3)
+        self.assertIn(self.user.id, results[disliked.id]['dislikes'])
+
+        # Cached per viewer
+        answer = self.client.get('/api/questions/').data['results'][0]['answers'][0]
+        self.assertEqual(answer['my_vote'], 'like')
+        self.client.force_authenticate(self.other)
+        self.assertIsNone(self.client.get('/api/questions/').data['results'][0]['answers'][0]['my_vote'])
+
+    def test_queries_do_not_grow_with_the_thread(self):
+        for _ in range(3):
+            self.answer(likes=1)
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url + '?page_size=2')
+        self.assertEqual(response.data['answers_count'], 3)
+        for _ in range(30):
+            self.answer(likes=1)
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url + '?page_size=2')
+        self.assertEqual(response.data['answers_count'], 33)
+        with self.assertNumQueries(4):
+            response = self.client.get(response.data['next'])
+        self.assertNotIn('answers_count', response.data)
+
+
+class FieldsetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.question_id = self.ask(['django'])
+        self.answer = Answer.objects.create(text='a', author=self.other, question_id=self.question_id)
+        cast_vote(self.answer, self.user, 'like')
+        cache.clear()
+
+    def get(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results'], [query['sql'] for query in queries]
+
+    def test_fields_trim_output_and_queries(self):
+        results, full = self.get('/api/questions/')
+        self.assertIn('description', results[0])
+
+        results, queries = self.get('/api/questions/?fields=id,title,tags.name')
+        self.assertEqual(results, [{'id': self.question_id, 'title': 'How?', 'tags': [{'name': 'django'}]}])
+        self.assertEqual(len(queries), len(full) - 2)
+        self.assertFalse(any('description' in sql or 'qa_answer' in sql for sql in queries))
+
+    def test_nested_fields_and_expand(self):
+        url = '/api/questions/?fields=id,answers.text,answers.my_vote&expand=answers.likes'
+        results, _ = self.get(url)
+        self.assertEqual(results[0]['answers'], [{'text': 'a', 'my_vote': 'like', 'likes': [self.user.id]}])
+
+        results, _ = self.get(f'/api/questions/{self.question_id}/list-answers/?fields=id,like_count')
+        self.assertEqual(results, [{'id': self.answer.id, 'like_count': 1}])
+
+        self.assertEqual(self.client.get('/api/questions/?fields=id,answers.nope').status_code, 400)
+
+
+class CachingTests(APITestCase):
+    def test_writes_invalidate_cached_responses(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/tags/').data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='x')
+        self.assertEqual(len(self.client.get('/api/tags/').data), 1)
+
+        question = Question.objects.create(title='t', description='d', author=self.other)
+        answer = Answer.objects.create(text='a', author=self.other, question=question)
+        self.client.get('/api/questions/')
+        self.other.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        self.assertEqual(self.client.get('/api/questions/').data['results'][0]['answers'][0]['author'], 'renamed')
+
+        url = f'/api/users/{self.other.id}/reputation/'
+        self.assertEqual(self.client.get(url).data['reputation'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/answers/{answer.id}/like/')
+        self.assertEqual(self.client.get(url).data['reputation'], 10)
+
+    def test_only_questions_with_changed_answers_are_reported(self):
+        question = Question.objects.create(title='t', description='d', author=self.other)
+        elsewhere = Question.objects.create(title='t', description='d', author=self.other)
+        answer = Answer.objects.create(text='a', author=self.other, question=question)
+        unchanged = Answer.objects.create(text='a', author=self.other, question=elsewhere)
+        sent = []
+
+        def receiver(sender, question_ids, **kwargs):
+            sent.append(question_ids)
+        votes_changed.connect(receiver)
+        self.addCleanup(votes_changed.disconnect, receiver)
+
+        answers = {a.id: (a.author_id, a.question_id) for a in (answer, unchanged)}
+        apply_vote_deltas({answer.id: (1, 0), unchanged.id: (0, 0)}, answers=answers)
+        self.assertEqual(sent, [{question.id}])
+
+    def test_invalidation_waits_for_commit(self):
+        self.client.get('/api/tags/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='x')
+            self.assertEqual(self.client.get('/api/tags/').data, [])
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.client.get('/api/tags/').data), 1)
+
+    def test_local_memory_cache_fails_the_deploy_check(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ['stayconnected.W001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/x',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_answers_etag(self):
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        answer = Answer.objects.create(text='x', author=self.other, question=question)
+        url = f'/api/questions/{question.id}/list-answers/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(f'/api/answers/{answer.id}/like/')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/questions/999/list-answers/').status_code, 404)
+
+    def test_deletes_are_never_not_modified(self):
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        answer = Answer.objects.create(text='x', author=self.other, question=question)
+        url = f'/api/questions/{question.id}/list-answers/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+        older = Question.objects.create(title='older', description='d', author=self.user)
+        newer = Question.objects.create(title='newer', description='d', author=self.user)
+        etag = self.client.get('/api/questions/?page_size=1')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            newer.delete()
+        response = self.client.get('/api/questions/?page_size=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], older.id)
+
+
+class AcceptAnswerTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.third = User.objects.create_user(username='third', email='third@example.com', password='password')
+        self.question = Question.objects.get(id=self.ask(['django']))
+        self.first = Answer.objects.create(text='a', author=self.other, question=self.question)
+        self.second = Answer.objects.create(text='b', author=self.third, question=self.question)
+
+    def accept(self, answer):
+        return self.client.post(f'/api/answers/{answer.id}/mark-correct/')
+
+    def accepted(self, user):
+        user.refresh_from_db()
+        return user.accepted_count, user.reputation
+
+    def test_switching_moves_the_counters(self):
+        self.assertEqual(self.accept(self.first).status_code, 200)
+        self.assertEqual(self.accepted(self.other), (1, 15))
+        self.assertTrue(Question.objects.get(pk=self.question.pk).completed)
+        self.assertEqual(Tag.objects.get(name='django').completed_count, 1)
+
+        self.accept(self.second)
+        self.accept(self.second)
+        self.assertEqual((self.accepted(self.other), self.accepted(self.third)), ((0, 0), (1, 15)))
+        self.assertEqual(list(self.question.answers.filter(is_correct=True)), [self.second])
+        self.assertEqual(Tag.objects.get(name='django').completed_count, 1)
+        self.assertEqual(reconcile_vote_counts(), 0)
+
+    def test_switch_cost_is_constant(self):
+        self.accept(self.first)
+        with CaptureQueriesContext(connections['default']) as few:
+            self.accept(self.second)
+        for i in range(20):
+            Answer.objects.create(text='c', author=self.user, question=self.question)
+        with self.assertNumQueries(len(few)):
+            self.accept(self.first)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_accepting_does_not_reindex(self):
+        Task.objects.all().delete()
+        self.first.is_correct = True
+        self.first.save()
+        for row in claim(10):
+            run(row)
+        self.assertTrue(Question.objects.get(pk=self.question.pk).completed)
+        self.accept(self.second)
+        self.assertFalse(Task.objects.filter(name='qa.index_question').exists())
+
+    def test_only_the_asker_can_accept(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.accept(self.first).status_code, 403)
+        self.assertEqual(self.client.post('/api/answers/999/mark-correct/').status_code, 404)
+        self.assertFalse(Answer.objects.filter(is_correct=True).exists())
+
+
+class TagTests(APITestCase):
+    def counts(self):
+        return {tag.name: (tag.question_count, tag.completed_count) for tag in Tag.objects.all()}
+
+    def test_names_are_normalized_and_reused(self):
+        Tag.objects.create(name='django')
+        self.ask([' Django', 'python', 'PYTHON'])
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)), ['django', 'python'])
+        self.assertEqual(len(tag_index.get('python')), 1)
+
+        Tag.objects.get(name='python').delete()
+        self.ask(['python'])
+        self.assertEqual(Tag.objects.get(name='python').question_count, 1)
+
+    def test_tags_created_by_questions_are_listed(self):
+        self.assertEqual(self.client.get('/api/tags/').data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ask(['newtag'])
+        self.assertEqual([tag['name'] for tag in self.client.get('/api/tags/').data], ['newtag'])
+
+    def test_tags_created_directly_are_normalized(self):
+        response = self.client.post('/api/tags/', {'name': ' Django'}, format='json')
+        self.assertEqual((response.status_code, response.data['name']), (201, 'django'))
+        self.assertEqual(self.client.post('/api/tags/', {'name': 'DJANGO'}, format='json').status_code, 400)
+        self.ask(['django'])
+        self.assertEqual(self.counts(), {'django': (1, 0)})
+        self.assertEqual(self.client.get('/api/questions/search/?query=details&tag=Django').data['count'], 1)
+
+    def test_migration_merges_names_differing_in_case(self):
+        upper, lower = Tag.objects.create(name='Django'), Tag.objects.create(name='django')
+        Tag.objects.create(name='Python ')
+        for tags in ([upper, lower], [upper]):
+            Question.objects.create(title='t', description='d', author=self.user).tags.add(*tags)
+
+        import_module('qa.migrations.0010_normalize_tag_names').normalize_tag_names(apps, None)
+        self.assertEqual(self.counts(), {'django': (2, 0), 'python': (0, 0)})
+        self.assertEqual(list(Question.tags.through.objects.values_list('tag_id', flat=True)), [lower.id] * 2)
+
+    def test_counts(self):
+        first = self.ask(['django', 'python'])
+        self.ask(['django'])
+        self.assertEqual(self.counts(), {'django': (2, 0), 'python': (1, 0)})
+
+        answer = Answer.objects.create(text='x', author=self.other, question_id=first)
+        self.client.post(f'/api/answers/{answer.id}/mark-correct/')
+        self.assertEqual(self.counts(), {'django': (2, 1), 'python': (1, 1)})
+
+        Question.objects.get(id=first).tags.remove(Tag.objects.get(name='python'))
+        self.assertEqual(self.counts(), {'django': (2, 1), 'python': (0, 0)})
+        Question.objects.get(id=first).delete()
+        self.assertEqual(self.counts(), {'django': (1, 0), 'python': (0, 0)})
+
+        Tag.objects.update(question_count=99)
+        reconcile_tag_counts()
+        self.assertEqual(self.counts(), {'django': (1, 0), 'python': (0, 0)})
+
+    def test_popular(self):
+        for tags in (['django'], ['django', 'django1'], ['django', 'django0'], ['django1'], ['other']):
+            self.ask(tags)
+        response = self.client.get('/api/tags/popular/?prefix=DJ&page_size=2')
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['django', 'django1'])
+        self.assertEqual(response.data['results'][0]['open_count'], 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['django0'])
+
+    def test_popular_finds_tags_created_in_mixed_case(self):
+        self.client.post('/api/tags/', {'name': 'DjangoCMS'}, format='json')
+        response = self.client.get('/api/tags/popular/?prefix=Djangoc')
+        self.assertEqual([tag['name'] for tag in response.data['results']], ['djangocms'])
+
+
+class BulkTests(APITestCase):
+    def test_export_import_roundtrip(self):
+        tag = Tag.objects.create(name='django')
+        question = Question.objects.create(title='Running migrations', description='deploy', author=self.user)
+        question.tags.add(tag)
+        answer = Answer.objects.create(text='x', author=self.other, question=question, is_correct=True)
+        cast_vote(answer, self.user, 'like')
+        user_fields = ('id', 'like_count', 'accepted_count', 'reputation', 'answer_count', 'created_at')
+        users = list(User.objects.order_by('id').values(*user_fields))
+        created_at = question.created_at
+
+        out = io.StringIO()
+        call_command('export_ndjson', stdout=out, stderr=io.StringIO())
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        Tag.objects.create(name='django')
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(out.getvalue())
+            file.flush()
+            call_command('import_ndjson', file.name, stdout=io.StringIO())
+
+        self.assertEqual(list(User.objects.order_by('id').values(*user_fields)), users)
+        question = Question.objects.get(id=question.id)
+        self.assertEqual(question.created_at, created_at)
+        self.assertEqual(list(question.tags.values_list('name', flat=True)), ['django'])
+        self.assertEqual(Answer.objects.get(id=answer.id).like_count, 1)
+        self.assertEqual(get_search_backend().search('migrations').count(), 1)
+
+
+class SeedingTests(TestCase):
+    def test_seed(self):
+        out = io.StringIO()
+        call_command('seed_data', users=20, tags=10, questions=60, seed=3, stdout=out)
+        self.assertIn('60 questions', out.getvalue())
+        self.assertEqual(Question.objects.count(), 60)
+        # Tag popularity is skewed towards the first tags
+        counts = dict(Tag.objects.values_list('name', 'question_count'))
+        self.assertGreater(counts['topic-0'], counts['topic-9'])
+        self.assertEqual(sum(counts.values()), Question.tags.through.objects.count())
+        # Derived counters match the rows
+        self.assertEqual(reconcile_vote_counts(), 0)
+        completed = Question.objects.filter(completed=True)
+        self.assertEqual(completed.count(), Answer.objects.filter(is_correct=True).count())
+        self.assertTrue(Question.objects.order_by('id').first().created_at
+                        <= Question.objects.order_by('id').last().created_at)
+
+
+@override_settings(TASKS_EAGER=False)
+class BenchmarkTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        benchmark.check_coverage()
+        with self.assertRaisesMessage(ValueError, 'popular-tags GET'):
+            benchmark.check_coverage([s for s in benchmark.SCENARIOS if s.name != 'popular-tags'])
+
+    def test_scenarios_run(self):
+        Seeder(users=10, tags=5, questions=20, seed=1).run()
+        fixtures = benchmark.Fixtures()
+        client = APIClient()
+        for scenario in benchmark.SCENARIOS:
+            with self.subTest(scenario.key):
+                stats = benchmark.measure(client, fixtures, scenario, iterations=1, warmup=0)
+                self.assertGreater(stats['queries'], 0)
+
+    def test_compare(self):
+        baseline = benchmark.query_counts({'small': {'profile GET': {'queries': 2, 'p95_ms': 10.0}}})
+        self.assertEqual(baseline, {'small': {'profile GET': {'queries': 2}}})
+        # Latency alone is never a regression
+        self.assertEqual(benchmark.compare({'small': {'profile GET': {'queries': 2, 'p95_ms': 90.0}}}, baseline), [])
+        regressions = benchmark.compare({'small': {'profile GET': {'queries': 3, 'p95_ms': 1.0}}}, baseline)
+        self.assertEqual(regressions, ['small profile GET: 3 queries, baseline 2'])
+
+
+class RenderingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(10):
+            question_id = self.ask(['django'], description='Details ' * 20)
+        Answer.objects.create(text='Ünïcode answer', author=self.other, question_id=question_id)
+        self.url = f'/api/questions/{question_id}/list-answers/'
+
+    def test_orjson_matches_drf(self):
+        for url in ('/api/questions/', self.url):
+            response = self.client.get(url)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_msgpack(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.client.get(self.url).content))
+
+        body = msgpack.packb({'title': 'Packed?', 'description': 'd', 'tags': ['msgpack']})
+        response = self.client.post('/api/questions/', body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201, response.data)
+        response = self.client.post('/api/questions/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_compression(self):
+        plain = self.client.get('/api/questions/').content
+        response = self.client.get('/api/questions/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+        # Too small to bother
+        response = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get('/api/questions/').content
+        response = self.client.get('/api/questions/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain)
+
+
+class MetricsTests(APITestCase):
+    def test_metrics_endpoint(self):
+        registry.reset()
+        for _ in range(3):
+            self.client.get('/api/questions/')
+        self.client.get('/nope/')
+
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/metrics').status_code, 404)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(anonymous.get('/metrics').status_code, 401)
+            body = anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        self.assertIn('http_requests_total{view="question-list-create",method="GET",status="200"} 3', body)
+        self.assertIn('view="unresolved"', body)
+
+
+class DatabaseRoutingTests(TransactionTestCase):
+    # Outside a test transaction, so reads are free to go to the replica (a mirror of default here)
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', email='asker@example.com', password='password')
+        self.other = User.objects.create_user(username='helper', email='helper@example.com', password='password')
+        self.client = APIClient()
+        self.login(self.user)
+        cache.clear()
+
+    def login(self, user):
+        # A real token, so authentication sees the user's recent writes
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(user).access_token}')
+
+    def queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica:
+            response = getattr(self.client, method)(*args, **kwargs)
+        self.assertLess(response.status_code, 300, response.data)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        primary, replica = self.queries('get', '/api/questions/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writers_read_their_writes(self):
+        primary, replica = self.queries('post', '/api/questions/', {
+            'title': 't', 'description': 'd', 'tags': ['django'],
+        }, format='json')
+        self.assertEqual(replica, 0)
+        self.assertEqual(self.queries('get', '/api/personal/questions/')[1], 0)
+
+        self.login(self.other)
+        self.assertEqual(self.queries('get', '/api/personal/questions/')[0], 0)
@@ -0,0 +1,88 @@
+"""
+Trending scores.
+
+A question's trending score is its activity (being asked, answers, likes)
+with every event's weight halved each ``TRENDING_HALF_LIFE_HOURS``. Decaying
+all scores at the same rate doesn't change their order, so instead of
+lowering old scores the weight of a new event grows with time: an event of
+weight ``w`` at time ``t`` adds ``w * 2 ** ((t - EPOCH) / half_life)``. The
+sum is stored as its natural log in ``Question.trending_score`` (the raw sum
+would overflow within a few years), so an event is one
+``score = logaddexp(score, event_score)`` UPDATE and the feed is a plain
+index scan on ``(-trending_score, -id)``.
+
+Signal receivers in qa.signals add the events as they happen;
+``recompute_trending`` rebuilds the scores from the tables, e.g. after a bulk
+load or a change of the half-life. The vote tables keep no timestamps, so it
+dates likes at their answer.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import Answer, Question
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+QUESTION_WEIGHT = 1.0
+ANSWER_WEIGHT = 3.0
+LIKE_WEIGHT = 1.0
+
+
+def event_score(weight, at=None):
+    """Log of the weight an event adds at time ``at`` (default now)."""
+    elapsed = ((at or timezone.now()) - EPOCH).total_seconds()
+    return math.log(weight) + elapsed * math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def add_activity(weights, at=None):
+    """
+    Add events to questions in one UPDATE: ``weights`` maps question ids to
+    the total weight of their new events.
+    """
+    scores = {pk: event_score(weight, at) for pk, weight in weights.items() if weight > 0}
+    if not scores:
+        return
+    if len(set(scores.values())) == 1:
+        score = Value(next(iter(scores.values())))
+    else:
+        score = Case(*[When(pk=pk, then=Value(value)) for pk, value in scores.items()], output_field=FloatField())
+    # log(e^a + e^b) without overflow: max(a, b) + log(1 + e^-|a - b|)
+    Question.objects.filter(id__in=list(scores)).update(
+        trending_score=Greatest(F('trending_score'), score) + Ln(1 + Exp(-Abs(F('trending_score') - score))),
+    )
+
+
+def _logsumexp(scores):
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def recompute_trending(using=None, batch_size=2000):
+    """
+    Recompute every question's score from its answers and likes,
+    ``batch_size`` questions (by id) at a time so memory stays flat.
+    """
+    questions = Question.objects.using(using) if using else Question.objects.all()
+    answers = Answer.objects.db_manager(questions.db)
+    last_id = 0
+    while True:
+        chunk = list(questions.filter(id__gt=last_id).order_by('id').values_list('id', 'created_at')[:batch_size])
+        if not chunk:
+            break
+        events = {pk: [event_score(QUESTION_WEIGHT, created_at)] for pk, created_at in chunk}
+        first_id, last_id = chunk[0][0], chunk[-1][0]
+        rows = answers.filter(question_id__gte=first_id, question_id__lte=last_id).values_list(
+            'question_id', 'created_at', 'like_count',
+        )
+        for question_id, created_at, likes in rows.iterator():
+            events[question_id].append(event_score(ANSWER_WEIGHT, created_at))
+            if likes > 0:
+                events[question_id].append(event_score(LIKE_WEIGHT * likes, created_at))
+
+        rows = [Question(pk=pk, trending_score=_logsumexp(scores)) for pk, scores in events.items()]
+        Question.objects.db_manager(questions.db).bulk_update(rows, ['trending_score'], batch_size=batch_size)
@@ -1,13 +1,25 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.permissions import IsAuthenticated
+from .accepting import accept_answer
 from .models import Question, Answer, Tag
-from .serializers import QuestionSerializer, CreateQuestionSerializer, AnswerSerializer, TagSerializer
-from django.db.models import Q
+from .search import get_search_backend
+from .tag_index import BitmapResults, tag_index
+from .tags import attach_tags, normalize_tag_name, tag_resolver
+from .votes import VOTE_ACTIONS, cast_vote, cast_votes
+from .serializers import QuestionSerializer, CreateQuestionSerializer, AnswerSerializer, TagSerializer, \
+    BatchVoteSerializer, PopularTagSerializer, wants_voters
 from django_filters.rest_framework import DjangoFilterBackend
+from stayconnected.caching import cache_response, question_namespace
+from stayconnected.conditional import conditional_get
+from stayconnected.fieldsets import FieldSelection
+from stayconnected.pagination import KeysetPagination
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -16,41 +28,134 @@ class CustomPageNumberPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class QuestionFeedPagination(KeysetPagination):
+    page_size = 10
+    ordering = ('-created_at', '-id')
+
+    def paginate_bitmap(self, bitmap, queryset, request, view=None):
+        """
+        Same cursor contract as paginate_queryset, but the candidates come from
+        a tag bitmap walked in descending id order (ids are allocated in
+        creation order), so the database only loads the rows on this page.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [self._parse_field(field) for field in self.ordering]
+        position = self.decode_cursor(request, queryset.model)
+
+        # Ids whose rows are gone (deleted by another process the index hasn't
+        # caught up with yet) are skipped by reading further down the bitmap
+        rows, below = [], position[-1] if position else None
+        while len(rows) <= self.page_size:
+            ids = bitmap.top(self.page_size + 1 - len(rows), below=below)
+            if not ids:
+                break
+            found = queryset.in_bulk(ids)
+            rows += [found[pk] for pk in ids if pk in found]
+            below = ids[-1]
+        # Rows stay in bitmap order, so the cursor is the smallest id on the
+        # page even where ids and created_at disagree
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+
+class TrendingFeedPagination(KeysetPagination):
+    page_size = 10
+    ordering = ('-trending_score', '-id')
+
+
+class AnswerPagination(KeysetPagination):
+    page_size = 20
+    orderings = {
+        'top': ('-is_correct', '-score', '-id'),
+        'oldest': ('created_at', 'id'),
+        'newest': ('-created_at', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        sort = request.query_params.get('sort', 'top')
+        if sort not in self.orderings:
+            raise ValidationError({'sort': f'Expected one of: {", ".join(self.orderings)}.'})
+        return self.orderings[sort]
+
+
+class TagPopularityPagination(KeysetPagination):
+    page_size = 50
+    max_page_size = 200
+    ordering = ('-question_count', '-id')
+
+
 class QuestionListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = QuestionFeedPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['tags__name']
 
-    def get(self, request):
-        tags = self.request.query_params.getlist('tags')
-        questions = Question.objects.all()
-        questions = questions.order_by('-created_at')
-        tag_queries = Q()
-        for tag in tags:
-            tag_queries |= Q(tags__name__iexact=tag)
+    def paginate(self, request, questions):
+        paginator = self.pagination_class()
+        tags = request.query_params.getlist('tags')
         if tags:
-            questions = questions.filter(tag_queries).distinct()
-        questions = questions.filter(tag_queries).distinct()
-        serializer = QuestionSerializer(questions, many=True)
-        return Response(serializer.data)
+            match_all = request.query_params.get('tag_match') == 'all'
+            bitmap = tag_index.all_of(tags) if match_all else tag_index.any_of(tags)
+            page = paginator.paginate_bitmap(bitmap, questions, request, view=self)
+        else:
+            page = paginator.paginate_queryset(questions, request, view=self)
+        return paginator, page
+
+    def get_validators(self, request):
+        # The page's ids and stamps, read from the feed index without the bodies
+        _, page = self.paginate(request, Question.objects.only('id', 'created_at', 'updated_at'))
+        return [(question.id, question.updated_at) for question in page]
+
+    @conditional_get(lambda view, request: view.get_validators(request))
+    @cache_response(['questions', 'users'], vary_on_user=True)
+    def get(self, request):
+        questions = QuestionSerializer.setup_eager_loading(
+            Question.objects.all(), FieldSelection.from_request(request), keep=('created_at',),
+            voters=wants_voters(request),
+        )
+        paginator, page = self.paginate(request, questions)
+        serializer = QuestionSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = CreateQuestionSerializer(data=request.data)
         if serializer.is_valid():
-            tags_data = request.data.get('tags', [])
-            tags = []
-            for tag_name in tags_data:
-                tag, created = Tag.objects.get_or_create(id=tag_name)
-                tags.append(tag)
-
-            question = serializer.save(author=request.user)
-            question.tags.set(tags)
-            question.save()
+            with transaction.atomic():
+                tag_ids = tag_resolver.resolve(serializer.validated_data.pop('tags', []))
+                question = serializer.save(author=request.user)
+                attach_tags(question, tag_ids.values())
             return Response(QuestionSerializer(question).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TrendingQuestionListAPIView(APIView):
+    """
+    Questions by recent activity (see qa.trending), hottest first. ``tags``
+    (repeatable) keeps questions with any of them. Scores keep moving, so a
+    question can show up twice, or be skipped, while a client scrolls.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = TrendingFeedPagination
+
+    @cache_response(['questions', 'users'], vary_on_user=True)
+    def get(self, request):
+        questions = QuestionSerializer.setup_eager_loading(
+            Question.objects.all(), FieldSelection.from_request(request), voters=wants_voters(request),
+        )
+        tags = [normalize_tag_name(name) for name in request.query_params.getlist('tags')]
+        if tags:
+            questions = questions.filter(Exists(
+                Question.tags.through.objects.filter(question_id=OuterRef('pk'), tag__name__in=tags)
+            ))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(questions, request, view=self)
+        serializer = QuestionSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
 class UserQuestionListAPIView(APIView):
     """
     API endpoint to retrieve questions created by the authenticated user.
@@ -61,7 +166,10 @@ class UserQuestionListAPIView(APIView):
     def get(self, request):
         questions = Question.objects.filter(author=request.user)
         questions = questions.order_by('-created_at')
-        serializer = QuestionSerializer(questions, many=True)
+        questions = QuestionSerializer.setup_eager_loading(
+            questions, FieldSelection.from_request(request), voters=wants_voters(request),
+        )
+        serializer = QuestionSerializer(questions, many=True, context={'request': request})
         return Response({
             'total_questions': questions.count(),
             'results': serializer.data
@@ -88,48 +196,66 @@ class LikeDislikeAnswerAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, answer_id, action):
+        if action not in VOTE_ACTIONS:
+            return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            answer = Answer.objects.get(id=answer_id)
+            answer = Answer.objects.only('id', 'author_id', 'question_id').get(id=answer_id)
         except Answer.DoesNotExist:
             return Response({"error": "Answer not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if action == "like":
-            answer.likes.add(request.user)
-            answer.dislikes.remove(request.user)
-        elif action == "dislike":
-            answer.dislikes.add(request.user)
-            answer.likes.remove(request.user)
-        else:
-            return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
-
+        cast_vote(answer, request.user, action)
         return Response({"success": "Action performed"}, status=status.HTTP_200_OK)
 
 
+class BatchVoteAnswersAPIView(APIView):
+    """
+    Apply a list of {answer_id, action} votes (like, dislike or clear) in one
+    transaction, e.g. when a client syncs votes made offline. When the same
+    answer appears more than once, the last entry wins.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BatchVoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        votes = {vote['answer_id']: vote['action'] for vote in serializer.validated_data['votes']}
+        changed, missing = cast_votes(request.user, votes)
+        return Response({
+            "success": "Votes applied",
+            "changed": changed,
+            "not_found": missing,
+        }, status=status.HTTP_200_OK)
+
+
 class MarkCorrectAnswerAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, answer_id):
         try:
-            answer = Answer.objects.get(id=answer_id)
+            answer = Answer.objects.select_related('question').only(
+                'id', 'author_id', 'question_id', 'question__author_id',
+            ).get(id=answer_id)
         except Answer.DoesNotExist:
             return Response({"error": "Answer not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if answer.question.author != request.user:
+        if answer.question.author_id != request.user.pk:
             return Response({"error": "Only the question author can mark an answer as correct"},
                             status=status.HTTP_403_FORBIDDEN)
 
-        Answer.objects.filter(question=answer.question).update(is_correct=False)
-        answer.is_correct = True
-        answer.save()
+        accept_answer(answer)
         return Response({"success": "Answer marked as correct"}, status=status.HTTP_200_OK)
 
 
 class TagListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_response(['tags'])
     def get(self, request):
         tags = Tag.objects.all()
-        serializer = TagSerializer(tags, many=True)
+        serializer = TagSerializer(tags, many=True, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -140,57 +266,104 @@ class TagListCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class SearchAPIView(APIView):
+class PopularTagListAPIView(APIView):
+    """
+    Tags by number of questions, most used first, e.g. for a tag cloud or
+    picker. ``prefix`` narrows to names starting with it.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = TagPopularityPagination
+
+    @cache_response(['tags', 'tag-counts'])
     def get(self, request):
-        query = request.GET.get('query', '')
-        tag = request.GET.get('tag', None)
+        tags = Tag.objects.all()
+        prefix = normalize_tag_name(request.query_params.get('prefix', ''))
+        if prefix:
+            # Names are stored normalized (qa.tags), so a case-sensitive match can use qa_tag_name_prefix_idx
+            tags = tags.filter(name__startswith=prefix)
 
-        questions = Question.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(tags, request, view=self)
+        serializer = PopularTagSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class SearchAPIView(APIView):
+    pagination_class = CustomPageNumberPagination
+
+    def get(self, request):
+        query = request.GET.get('query', '').strip()
+        tag = normalize_tag_name(request.GET.get('tag', '')) or None
 
-        if tag:
-            questions = questions.filter(tags__name=tag)
+        if query:
+            questions = get_search_backend().search(query, tag=tag)
+        elif tag:
+            questions = BitmapResults(tag_index.get(tag), Question.objects.prefetch_related('tags'))
+        else:
+            questions = Question.objects.prefetch_related('tags').order_by('-created_at', '-id')
 
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(questions, request, view=self)
         results = [
             {
                 "id": question.id,
                 "title": question.title,
                 "description": question.description,
-                "tags": [tag.name for tag in question.tags.all()]
+                "tags": [tag.name for tag in question.tags.all()],
+                "rank": getattr(question, 'rank', None),
+                "snippet": getattr(question, 'snippet', None),
             }
-            for question in questions
+            for question in page
         ]
 
-        return Response(results, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(results)
 
 
 class QuestionAnswersListView(generics.ListAPIView):
     """
-    API endpoint to retrieve all answers for a specific question,
-    including detailed user information.
+    A question with a page of its answers, including detailed user
+    information. ``sort`` is ``top`` (the accepted answer, then by likes minus
+    dislikes; the default), ``oldest`` or ``newest``; follow ``next`` for more.
     """
     serializer_class = AnswerSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AnswerPagination
+
+    def get_question(self):
+        if not hasattr(self, '_question'):
+            self._question = get_object_or_404(
+                Question.objects.select_related('author'), id=self.kwargs.get('question_id'),
+            )
+        return self._question
 
     def get_queryset(self):
-        question_id = self.kwargs.get('question_id')
-        question = get_object_or_404(Question, id=question_id)
-        return Answer.objects.filter(question=question).select_related('author').prefetch_related('likes', 'dislikes')
+        return AnswerSerializer.setup_eager_loading(
+            Answer.objects.filter(question=self.get_question()), FieldSelection.from_request(self.request),
+            keep=('is_correct', 'created_at'), voters=wants_voters(self.request),
+        )
+
+    def get_validators(self, request, question_id):
+        updated_at = Question.objects.filter(id=question_id).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return question_id, updated_at
 
+    @conditional_get(lambda view, request, question_id: view.get_validators(request, question_id))
+    @cache_response(lambda request, question_id: [question_namespace(question_id), 'users'], vary_on_user=True)
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
-        question_id = self.kwargs.get('question_id')
-        question = get_object_or_404(Question, id=question_id)
-        response.data = {
+        question = self.get_question()
+        data = {
             'question_id': question.id,
             'question_title': question.title,
             'description': question.description,
             'author': question.author.username,
             'completed': question.completed,
             'created_at': question.created_at,
-            'answers_count': response.data.__len__(),
-            'results': response.data
         }
+        # Counted once, on the first page, instead of again for every page
+        if self.paginator.cursor_query_param not in request.query_params:
+            data['answers_count'] = question.answers.count()
+        response.data = {**data, 'next': response.data['next'], 'results': response.data['results']}
 
         return response
@@ -0,0 +1,303 @@
+"""
+Vote bookkeeping.
+
+``Answer.like_count``/``dislike_count`` and the author's ``User`` counters are
+denormalized from the likes/dislikes through tables and only ever moved by
+``F()`` deltas, so a vote costs the same no matter how many votes the answer
+or its author already has. ``reconcile_vote_counts`` recomputes everything
+from the through tables if the counters ever drift.
+
+Those deltas still lock the answer row until the vote commits, so the votes
+on one popular answer queue up behind each other. With
+``VOTES_WRITE_BEHIND`` a vote only inserts its through row and a
+``VoteDelta`` row; ``flush_vote_deltas`` (the ``qa.flush_votes`` task,
+enqueued at most once per ``VOTES_FLUSH_INTERVAL_MS``) sums the staged rows
+and applies them in one update per answer. Staged rows commit with the vote
+and are only deleted by the flush that applied them, so a crashed flush is
+simply run again; counters lag by the interval plus the worker's poll time.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .models import Answer, User, VoteDelta
+
+LIKE = 'like'
+DISLIKE = 'dislike'
+CLEAR = 'clear'
+VOTE_ACTIONS = (LIKE, DISLIKE)
+BATCH_VOTE_ACTIONS = (LIKE, DISLIKE, CLEAR)
+
+Likes = Answer.likes.through
+Dislikes = Answer.dislikes.through
+
+# Sent after answer counters change, with
+# author_deltas={author_id: (like_delta, dislike_delta)} for the User side and
+# the ids of the questions whose answers changed. New votes also come with
+# liked_questions={question_id: likes_added}.
+votes_changed = Signal()
+
+
+def apply_vote_deltas(deltas, answers=None):
+    """
+    Move answer counters by ``deltas`` ({answer_id: (like_delta, dislike_delta)})
+    and send ``votes_changed`` with the same deltas summed per author.
+    ``answers`` maps answer ids to ``(author_id, question_id)``; missing ones
+    are looked up.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    answers = dict(answers or {})
+    missing = [pk for pk in deltas if pk not in answers]
+    if missing:
+        answers.update(
+            (pk, (author_id, question_id))
+            for pk, author_id, question_id in Answer.objects.filter(id__in=missing).values_list(
+                'id', 'author_id', 'question_id'
+            )
+        )
+
+    # Answers moving by the same amounts share one UPDATE; a batch of votes
+    # only ever produces a handful of distinct deltas
+    answers_by_delta = defaultdict(list)
+    author_deltas = defaultdict(lambda: [0, 0])
+    liked_questions = defaultdict(int)
+    for answer_id, (likes, dislikes) in deltas.items():
+        answers_by_delta[likes, dislikes].append(answer_id)
+        if answer_id in answers:
+            author_deltas[answers[answer_id][0]][0] += likes
+            author_deltas[answers[answer_id][0]][1] += dislikes
+            if likes > 0:
+                liked_questions[answers[answer_id][1]] += likes
+    for (likes, dislikes), answer_ids in answers_by_delta.items():
+        Answer.objects.filter(id__in=answer_ids).update(
+            like_count=F('like_count') + likes,
+            dislike_count=F('dislike_count') + dislikes,
+            score=F('score') + likes - dislikes,
+        )
+
+    votes_changed.send(
+        sender=Answer,
+        author_deltas={pk: tuple(delta) for pk, delta in author_deltas.items()},
+        question_ids={answers[pk][1] for pk in deltas if pk in answers},
+        liked_questions=dict(liked_questions),
+    )
+
+
+def record_vote_deltas(deltas, answers=None):
+    """``apply_vote_deltas`` now, or staged for the flusher in write-behind mode."""
+    if not settings.VOTES_WRITE_BEHIND:
+        apply_vote_deltas(deltas, answers)
+        return
+    staged = [
+        VoteDelta(answer_id=pk, like_delta=likes, dislike_delta=dislikes)
+        for pk, (likes, dislikes) in deltas.items() if likes or dislikes
+    ]
+    if staged:
+        from .tasks import flush_votes
+
+        VoteDelta.objects.bulk_create(staged)
+        flush_votes.enqueue(dedupe_key='qa.flush_votes', delay=settings.VOTES_FLUSH_INTERVAL_MS / 1000)
+
+
+def flush_vote_deltas(limit=None):
+    """
+    Apply up to ``limit`` (default ``VOTES_FLUSH_BATCH``) staged deltas,
+    oldest first, and delete them. Rows locked by a concurrent flush are
+    skipped. Returns the number of rows applied.
+    """
+    with transaction.atomic():
+        rows = list(
+            VoteDelta.objects.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'answer_id', 'like_delta', 'dislike_delta')[:limit or settings.VOTES_FLUSH_BATCH]
+        )
+        deltas = defaultdict(lambda: [0, 0])
+        for _, answer_id, likes, dislikes in rows:
+            deltas[answer_id][0] += likes
+            deltas[answer_id][1] += dislikes
+        apply_vote_deltas({pk: tuple(delta) for pk, delta in deltas.items()})
+        VoteDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def votes_of(user, answer_ids):
+    """``user``'s votes on ``answer_ids`` as ``{answer_id: 'like' | 'dislike'}``, in one query."""
+    if not getattr(user, 'is_authenticated', False) or not answer_ids:
+        return {}
+    likes = Likes.objects.filter(user_id=user.pk, answer_id__in=answer_ids).annotate(
+        vote=Value(LIKE, output_field=CharField()),
+    ).values_list('answer_id', 'vote')
+    dislikes = Dislikes.objects.filter(user_id=user.pk, answer_id__in=answer_ids).annotate(
+        vote=Value(DISLIKE, output_field=CharField()),
+    ).values_list('answer_id', 'vote')
+    return dict(likes.union(dislikes, all=True))
+
+
+def _add_vote(through, answer_id, user_id):
+    try:
+        with transaction.atomic():
+            through.objects.create(answer_id=answer_id, user_id=user_id)
+    except IntegrityError:
+        # The vote already exists (or a concurrent request just inserted it)
+        return 0
+    return 1
+
+
+def cast_vote(answer, user, action):
+    """
+    Set ``user``'s vote on ``answer`` to ``'like'``, ``'dislike'`` or ``None``
+    (no vote). Counters only move when the vote actually changes.
+    Returns True if it did.
+    """
+    with transaction.atomic():
+        likes = dislikes = 0
+        if action != LIKE:
+            likes -= Likes.objects.filter(answer_id=answer.pk, user_id=user.pk).delete()[0]
+        if action != DISLIKE:
+            dislikes -= Dislikes.objects.filter(answer_id=answer.pk, user_id=user.pk).delete()[0]
+        if action == LIKE:
+            likes += _add_vote(Likes, answer.pk, user.pk)
+        elif action == DISLIKE:
+            dislikes += _add_vote(Dislikes, answer.pk, user.pk)
+        record_vote_deltas({answer.pk: (likes, dislikes)}, answers={answer.pk: (answer.author_id, answer.question_id)})
+    return bool(likes or dislikes)
+
+
+def cast_votes(user, votes):
+    """
+    Apply many of ``user``'s votes at once: ``votes`` maps answer ids to
+    ``'like'``, ``'dislike'`` or ``'clear'``. Runs in one transaction with one
+    read of the current votes, one bulk insert and one delete per vote table,
+    then one counter update per affected answer and author.
+    Returns ``(changed_ids, missing_ids)``.
+    """
+    with transaction.atomic():
+        # Serializes concurrent batches from the same voter so the diff below stays exact
+        User.objects.select_for_update().filter(pk=user.pk).exists()
+        answers = {
+            pk: (author_id, question_id)
+            for pk, author_id, question_id in Answer.objects.filter(id__in=list(votes)).values_list(
+                'id', 'author_id', 'question_id'
+            )
+        }
+        liked = set(Likes.objects.filter(user_id=user.pk, answer_id__in=answers).values_list('answer_id', flat=True))
+        disliked = set(
+            Dislikes.objects.filter(user_id=user.pk, answer_id__in=answers).values_list('answer_id', flat=True)
+        )
+
+        add = {Likes: [], Dislikes: []}
+        remove = {Likes: [], Dislikes: []}
+        deltas = {}
+        for answer_id, action in votes.items():
+            if answer_id not in answers:
+                continue
+            likes = dislikes = 0
+            if action == LIKE and answer_id not in liked:
+                add[Likes].append(answer_id)
+                likes = 1
+            elif action != LIKE and answer_id in liked:
+                remove[Likes].append(answer_id)
+                likes = -1
+            if action == DISLIKE and answer_id not in disliked:
+                add[Dislikes].append(answer_id)
+                dislikes = 1
+            elif action != DISLIKE and answer_id in disliked:
+                remove[Dislikes].append(answer_id)
+                dislikes = -1
+            if likes or dislikes:
+                deltas[answer_id] = (likes, dislikes)
+
+        for through in (Likes, Dislikes):
+            if remove[through]:
+                through.objects.filter(user_id=user.pk, answer_id__in=remove[through]).delete()
+            if add[through]:
+                through.objects.bulk_create([through(answer_id=pk, user_id=user.pk) for pk in add[through]])
+        record_vote_deltas(deltas, answers=answers)
+
+    return sorted(deltas), sorted(set(votes) - set(answers))
+
+
+def _vote_count(through):
+    return Coalesce(
+        Subquery(
+            through.objects.filter(answer_id=OuterRef('pk'))
+            .values('answer_id')
+            .annotate(total=Count('*'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def _author_total(field):
+    return Coalesce(
+        Subquery(
+            Answer.objects.filter(author_id=OuterRef('pk'))
+            .values('author_id')
+            .annotate(total=Sum(field))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def _count_per_author(answers):
+    return answers.values('author_id').annotate(total=Count('*')).values('total')
+
+
+def reconcile_vote_counts(answer_ids=None, using=None):
+    """
+    Recompute answer counters from the through tables, then every stored
+    total of the affected authors. Staged deltas of those answers are
+    dropped, since the through tables already include them. Returns the
+    number of answers whose counters had drifted.
+    """
+    answers = Answer.objects.using(using) if using else Answer.objects.all()
+    staged = VoteDelta.objects.using(answers.db)
+    if answer_ids is not None:
+        answers = answers.filter(id__in=answer_ids)
+        staged = staged.filter(answer_id__in=answer_ids)
+    staged.delete()
+    drifted = answers.annotate(
+        actual_likes=_vote_count(Likes),
+        actual_dislikes=_vote_count(Dislikes),
+    ).exclude(
+        like_count=F('actual_likes'),
+        dislike_count=F('actual_dislikes'),
+        score=F('actual_likes') - F('actual_dislikes'),
+    )
+    drifted_ids = list(drifted.values_list('id', flat=True))
+    if drifted_ids:
+        drifted_answers = answers.model.objects.db_manager(answers.db).filter(id__in=drifted_ids)
+        drifted_answers.update(
+            like_count=_vote_count(Likes),
+            dislike_count=_vote_count(Dislikes),
+        )
+        drifted_answers.update(score=F('like_count') - F('dislike_count'))
+
+    users = User.objects.using(answers.db)
+    if answer_ids is not None:
+        users = users.filter(id__in=answers.values('author_id'))
+    reconcile_author_counters(users)
+    return len(drifted_ids)
+
+
+def reconcile_author_counters(users):
+    """
+    Recompute the stored per-user totals (votes received, accepted answers,
+    answers written and reputation) from the answers table.
+    """
+    accepted = Answer.objects.filter(author_id=OuterRef('pk'), is_correct=True)
+    users.update(
+        like_count=_author_total('like_count'),
+        dislike_count=_author_total('dislike_count'),
+        accepted_count=Coalesce(Subquery(_count_per_author(accepted)), Value(0)),
+        answer_count=Coalesce(Subquery(_count_per_author(Answer.objects.filter(author_id=OuterRef('pk')))), Value(0)),
+    )
+    users.update(reputation=User.reputation_expression())
@@ -0,0 +1,265 @@
+"""
+Endpoint benchmarks against seeded data.
+
+Every route in ``qa.urls`` and ``user.urls`` has a scenario below; a route
+(or a method of its view) without one is an error, so new endpoints can't be
+left out. A test database is created and, for each dataset size, emptied
+and filled by ``qa.seeding.Seeder``, then each scenario is requested ``iterations``
+times through the test client with a real JWT. Every request runs in a
+transaction that is rolled back, so writes don't pile up between iterations,
+and the response cache is cleared first, so the numbers are for the
+uncached path. The result holds per-scenario latency percentiles (ms) and
+the number of queries. ``compare()`` checks only the query counts against a
+stored baseline: they are the same on every machine, while latencies are
+reported for reading but too noisy across machines to gate on.
+"""
+import json
+import math
+import time
+from contextlib import contextmanager
+from itertools import count
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from rest_framework.test import APIClient
+
+from qa.bulk import reset_in_process_state
+from qa.models import Answer, Question, Tag
+from qa.seeding import SIZES, Seeder
+from user.models import User
+from user.tokens import UserRefreshToken
+
+METHODS = ('get', 'post', 'put', 'patch', 'delete')
+
+
+class Scenario:
+    """
+    One request. ``path``, ``data`` and ``user`` may be callables taking the
+    ``Fixtures``; ``setup`` runs inside the rolled back transaction, before
+    the timer starts. Requests are made as ``Fixtures.user`` unless ``user``
+    says otherwise, or anonymously with ``auth=False``.
+    """
+
+    def __init__(self, name, method, path, data=None, format='json', status=200, auth=True, user=None,
+                 setup=None):
+        self.name, self.method, self.path, self.data = name, method, path, data
+        self.format, self.status, self.auth, self.user, self.setup = format, status, auth, user, setup
+
+    @property
+    def key(self):
+        return f'{self.name} {self.method.upper()}'
+
+    def resolve(self, fixtures, value):
+        return value(fixtures) if callable(value) else value
+
+
+class Fixtures:
+    """Rows of the seeded dataset the scenarios point at."""
+
+    def __init__(self):
+        # The most answered question; its author is the benchmark user
+        self.question = Question.objects.annotate(answer_total=Count('answers')).order_by('-answer_total', 'id')[0]
+        self.user = self.question.author
+        # Someone with a typical, small footprint
+        self.quiet_user = User.objects.annotate(
+            activity=Count('questions', distinct=True) + Count('answers', distinct=True),
+        ).order_by('activity', 'id')[0]
+        self.answer = self.question.answers.exclude(author=self.user).order_by('id').first() or \
+            self.question.answers.order_by('id').first()
+        self.tag = Tag.objects.order_by('-question_count', 'id').first()
+        self.answer_ids = list(
+            Answer.objects.exclude(author=self.user).order_by('-id').values_list('id', flat=True)[:20]
+        )
+        self.sequence = count()
+        self.tokens = {}
+
+    def unique(self, prefix):
+        return f'{prefix}{next(self.sequence)}'
+
+    def refresh_token(self):
+        return str(UserRefreshToken.for_user(self.user))
+
+    def access_token(self, user):
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = str(UserRefreshToken.for_user(user).access_token)
+        return self.tokens[user.pk]
+
+
+def _give_photo(fixtures):
+    User.objects.filter(pk=fixtures.user.pk).update(profile_photo='profile_photos/benchmark.jpg')
+
+
+SCENARIOS = [
+    # qa.urls
+    Scenario('question-list-create', 'get', '/api/questions/'),
+    Scenario('trending-questions', 'get', lambda f: f'/api/questions/trending/?tags={f.tag.name}'),
+    Scenario('question-list-create', 'post', '/api/questions/', status=201, data=lambda f: {
+        'title': 'How do I profile a slow endpoint?', 'description': 'It issues too many queries.',
+        'tags': [f.tag.name, f.unique('benchmark-')],
+    }),
+    Scenario('answer-list-create', 'post', lambda f: f'/api/questions/{f.question.pk}/answers/', status=201,
+             data={'text': 'Look at the query count first.'}),
+    Scenario('batch-vote-answers', 'post', '/api/answers/votes/', data=lambda f: {
+        'votes': [{'answer_id': answer_id, 'action': 'like'} for answer_id in f.answer_ids],
+    }),
+    Scenario('mark-correct-answer', 'post', lambda f: f'/api/answers/{f.answer.pk}/mark-correct/'),
+    Scenario('like-dislike-answer', 'post', lambda f: f'/api/answers/{f.answer.pk}/like/'),
+    Scenario('tag-list-create', 'get', '/api/tags/'),
+    Scenario('tag-list-create', 'post', '/api/tags/', status=201, data=lambda f: {'name': f.unique('bench-tag-')}),
+    Scenario('popular-tags', 'get', lambda f: f'/api/tags/popular/?prefix={f.tag.name[:3]}'),
+    Scenario('search-questions', 'get', '/api/questions/search/?query=django+cache'),
+    Scenario('question-answers', 'get', lambda f: f'/api/questions/{f.question.pk}/list-answers/'),
+    Scenario('user-questions', 'get', '/api/personal/questions/'),
+    # user.urls
+    Scenario('register', 'post', '/api/register/', status=201, auth=False, data=lambda f: {
+        'username': f.unique('bench-user-'), 'email': f.unique('bench-') + '@example.com',
+        'password': 'Bench-password-1', 'repeat_password': 'Bench-password-1',
+    }),
+    Scenario('login', 'post', '/api/login/', auth=False, data=lambda f: {
+        'identifier': f.user.username, 'password': 'seed-password',
+    }),
+    Scenario('token_refresh', 'post', '/api/token/refresh/', auth=False,
+             data=lambda f: {'refresh': f.refresh_token()}),
+    Scenario('logout', 'post', '/api/logout/', status=205, data=lambda f: {'refresh_token': f.refresh_token()}),
+    Scenario('profile', 'get', '/api/profile/'),
+    Scenario('profile', 'post', '/api/profile/', format='multipart', data={'status': 'Benchmarking'}),
+    Scenario('profile', 'delete', '/api/profile/', setup=_give_photo),
+    Scenario('user-reputation', 'get', lambda f: f'/api/users/{f.user.pk}/reputation/', auth=False),
+    Scenario('user-settings', 'patch', '/api/user/settings/',
+             data=lambda f: {'email': f.unique('bench-settings-') + '@example.com'}),
+    Scenario('user-reputation-list', 'get', '/api/users/reputation/', auth=False),
+    Scenario('user-delete', 'delete', '/api/users/delete/', status=204, user=lambda f: f.quiet_user),
+]
+
+
+def check_coverage(scenarios=SCENARIOS):
+    """Raise ``ValueError`` naming the routes/methods that have no scenario."""
+    import qa.urls
+    import user.urls
+
+    covered = {(scenario.name, scenario.method) for scenario in scenarios}
+    missing = []
+    for pattern in qa.urls.urlpatterns + user.urls.urlpatterns:
+        view_class = getattr(pattern.callback, 'view_class', None)
+        methods = [method for method in METHODS if view_class and hasattr(view_class, method)] or ['get']
+        missing += [f'{pattern.name} {method.upper()}' for method in methods if (pattern.name, method) not in covered]
+    if missing:
+        raise ValueError('No benchmark scenario for: ' + ', '.join(missing))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def measure(client, fixtures, scenario, iterations, warmup=2):
+    if scenario.auth:
+        user = scenario.resolve(fixtures, scenario.user) or fixtures.user
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {fixtures.access_token(user)}')
+    else:
+        client.credentials()
+    timings, queries = [], 0
+    for iteration in range(warmup + iterations):
+        cache.clear()
+        with transaction.atomic():
+            if scenario.setup:
+                scenario.setup(fixtures)
+            path = scenario.resolve(fixtures, scenario.path)
+            data = scenario.resolve(fixtures, scenario.data)
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, scenario.method)(path, data, format=scenario.format)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        if scenario.method != 'get':
+            # Rolled back writes may have reached the tag index or resolver cache
+            reset_in_process_state()
+        if response.status_code != scenario.status:
+            raise AssertionError(
+                f'{scenario.key} returned {response.status_code}, expected {scenario.status}: '
+                f'{response.content[:300]!r}'
+            )
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+            queries = max(queries, len(captured))
+    return {
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+@contextmanager
+def test_database():
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        # Production path: tasks are queued, not run inside the request. The
+        # periodic blacklist sync and user cache expiry would add a query to
+        # whichever request they happen to land on; keep them out of the counts
+        with override_settings(TASKS_EAGER=False, USER_AVATAR_ASYNC=False,
+                               AUTH_BLACKLIST_SYNC_SECONDS=math.inf, AUTH_USER_CACHE_TTL=math.inf):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        reset_in_process_state()
+
+
+def seed_dataset(size, seed=0):
+    call_command('flush', interactive=False, verbosity=0)
+    reset_in_process_state()
+    Seeder(**SIZES[size], seed=seed).run()
+
+
+def run(sizes=('small', 'medium'), iterations=30, seed=0, log=None, scenarios=SCENARIOS):
+    """Benchmark every scenario at every size; returns ``{size: {key: stats}}``."""
+    check_coverage(scenarios)
+    results = {}
+    with test_database():
+        for size in sizes:
+            seed_dataset(size, seed)
+            fixtures = Fixtures()
+            client = APIClient()
+            results[size] = {}
+            for scenario in scenarios:
+                results[size][scenario.key] = stats = measure(client, fixtures, scenario, iterations)
+                if log:
+                    log(f'{size:>8} {scenario.key:<32} {stats["queries"]:>4} queries  '
+                        f'p50 {stats["p50_ms"]:>8.2f} ms  p95 {stats["p95_ms"]:>8.2f} ms')
+    return results
+
+
+def compare(results, baseline):
+    """Regressions of ``results`` against ``baseline``: every scenario issuing more queries."""
+    regressions = []
+    for size, scenarios in results.items():
+        for key, stats in scenarios.items():
+            expected = baseline.get(size, {}).get(key)
+            if expected is not None and stats['queries'] > expected['queries']:
+                regressions.append(f'{size} {key}: {stats["queries"]} queries, baseline {expected["queries"]}')
+    return regressions
+
+
+def query_counts(results):
+    """The part of ``results`` kept as a baseline."""
+    return {size: {key: {'queries': stats['queries']} for key, stats in scenarios.items()}
+            for size, scenarios in results.items()}
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
@@ -0,0 +1,144 @@
+"""
+Versioned response cache for read endpoints.
+
+Every cached response is stored under a key that embeds the current version
+of each namespace it depends on (``tags``, ``questions``, ``question:<id>``,
+``user:<id>``). Writes never delete entries; the signal receivers in
+qa.signals and user.signals just bump the affected namespace versions, so
+stale entries become unreachable and age out on their own.
+
+Versions are bumped once the writing transaction commits. Bumping earlier
+would let a concurrent reader cache the old, still committed rows under the
+new version, where they would stay for the whole timeout.
+
+Works with any Django cache backend, but with more than one server process
+the backend must be shared (file-based or a cache server): local memory only
+sees the invalidations made by its own process. ``manage.py check --deploy``
+warns about a local memory backend.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def question_namespace(question_id):
+    return f'question:{question_id}'
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def _version_key(namespace):
+    return f'response-version:{namespace}'
+
+
+def get_versions(namespaces):
+    cache = get_cache()
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed from the clock so a namespace whose version was evicted
+            # never comes back at a number that old entries were stored under
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def invalidate(*namespaces):
+    """Bump the versions of ``namespaces`` when the current transaction commits (at once outside of one)."""
+    if namespaces:
+        transaction.on_commit(lambda: _bump(namespaces))
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES[settings.RESPONSE_CACHE_ALIAS]['BACKEND']
+    if settings.RESPONSE_CACHE_TIMEOUT and backend.endswith('LocMemCache'):
+        return [checks.Warning(
+            'Response caching uses a local memory cache, which other server processes never see '
+            'invalidations from.',
+            hint='Set CACHE_BACKEND/CACHE_LOCATION to a shared cache, or RESPONSE_CACHE_TIMEOUT=0.',
+            id='stayconnected.W001',
+        )]
+    return []
+
+
+def get_stats():
+    with _stats_lock:
+        return {
+            name: {'hits': _hits[name], 'misses': _misses[name]}
+            for name in sorted(set(_hits) | set(_misses))
+        }
+
+
+def _record(name, hit):
+    with _stats_lock:
+        (_hits if hit else _misses)[name] += 1
+
+
+def cache_response(namespaces, vary_on_user=False, timeout=None):
+    """
+    Cache the ``Response.data`` of a view method until one of its namespaces
+    is invalidated. ``namespaces`` is a list, or a callable taking the
+    request and the URL kwargs. Only 200 responses are stored; the data is
+    cached rather than rendered bytes, so content negotiation still applies.
+    """
+    def decorator(method):
+        name = method.__qualname__
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if settings.RESPONSE_CACHE_TIMEOUT == 0:
+                return method(view, request, *args, **kwargs)
+
+            names = namespaces(request, **kwargs) if callable(namespaces) else namespaces
+            parts = [
+                name,
+                request.path,
+                sorted(request.query_params.lists()),
+                request.user.pk if vary_on_user else None,
+                get_versions(names),
+            ]
+            key = 'response:%s:%s' % (name, hashlib.md5(repr(parts).encode('utf-8')).hexdigest())
+
+            cache = get_cache()
+            cached = cache.get(key)
+            if cached is not None:
+                _record(name, hit=True)
+                return Response(cached)
+
+            _record(name, hit=False)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, timeout if timeout is not None else settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,57 @@
+"""
+Response compression.
+
+Like Django's ``GZipMiddleware``, but only for bodies of at least
+``RESPONSE_COMPRESSION_MIN_BYTES`` (smaller ones gain little and cost CPU on
+both ends), and with Brotli preferred when the client accepts it and the
+``brotli`` package is installed. Already encoded and streaming responses
+are passed through. Gzip output keeps Django's random padding against
+BREACH-style length attacks.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_accepts_br = re.compile(r'\bbr\b')
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def _compress(content, accept_encoding):
+    if brotli is not None and _accepts_br.search(accept_encoding):
+        return 'br', brotli.compress(content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    if _accepts_gzip.search(accept_encoding):
+        return 'gzip', compress_string(content, max_random_bytes=100)
+    return None, content
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding, compressed = _compress(response.content, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # The body changed, so a strong ETag no longer holds (RFC 9110 8.8.3)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,89 @@
+"""
+Primary/replica database routing.
+
+``PrimaryReplicaRouter`` sends reads to a random alias of
+``DATABASE_REPLICAS`` and everything else to ``default``. A request is
+pinned to the primary, so it reads its own writes, when
+
+* its method is not GET/HEAD/OPTIONS,
+* it has written anything (the router sees every write),
+* the read happens inside ``transaction.atomic()`` on the primary, e.g.
+  ``select_for_update()``, or
+* its user wrote within the last ``DATABASE_REPLICA_PIN_SECONDS`` (recorded
+  in the default cache by ``DatabaseRoutingMiddleware``), so a client that
+  just posted sees its post on the next request despite replication lag.
+
+The pin lives in a context variable that the middleware resets per request.
+Outside requests (commands, the task worker) nothing resets it, so reads go
+to replicas until the thread first writes, and to the primary after that.
+With no replicas configured everything uses ``default``.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_pinned = ContextVar('db_routing_pinned', default=False)
+_wrote = ContextVar('db_routing_wrote', default=False)
+
+
+def _pin_key(user_id):
+    return f'db-routing:wrote:{user_id}'
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def pin_if_recent_writer(user_id):
+    """Called once the request's user is known (see user.authentication)."""
+    if settings.DATABASE_REPLICAS and not _pinned.get() and cache.get(_pin_key(user_id)):
+        _pinned.set(True)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class DatabaseRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        pinned, wrote = _pinned.set(request.method not in SAFE_METHODS), _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if _wrote.get() and user is not None and user.is_authenticated:
+                cache.set(_pin_key(user.pk), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+            return response
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
@@ -0,0 +1,75 @@
+"""
+Encoding benchmarks: how long each response format takes to encode a
+realistic payload, and how many bytes it produces before and after
+compression.
+
+The payload is ``QuestionSerializer`` output for the newest questions of a
+seeded dataset, answers included, as the feed sends it. Every renderer in
+``RENDERERS`` encodes it ``iterations`` times; the median time is reported,
+then the output is compressed with every encoding the compression
+middleware can send.
+"""
+import gzip
+import statistics
+import time
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from qa.models import Question
+from qa.serializers import QuestionSerializer
+from stayconnected import compression
+from stayconnected.benchmark import seed_dataset, test_database
+from stayconnected.renderers import MessagePackRenderer, ORJSONRenderer
+from user.models import User
+
+RENDERERS = {
+    'json (DRF)': JSONRenderer,
+    'json (orjson)': ORJSONRenderer,
+    'msgpack': MessagePackRenderer,
+}
+
+
+def payload(questions=100):
+    """The serialized feed page of the ``questions`` newest questions, as seen by their most active voter."""
+    request = Request(APIRequestFactory().get('/api/questions/'))
+    request.user = User.objects.order_by('-like_count', 'id').first()
+    page = QuestionSerializer.setup_eager_loading(Question.objects.order_by('-created_at', '-id'))[:questions]
+    return QuestionSerializer(page, many=True, context={'request': request}).data
+
+
+def _timed(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, round(statistics.median(timings), 3)
+
+
+def measure(data, iterations=20):
+    """``{renderer name: stats}`` with the encoded size and time, raw and compressed."""
+    codecs = {'gzip': lambda content: gzip.compress(content, compresslevel=6)}
+    if compression.brotli is not None:
+        codecs['br'] = lambda content: compression.brotli.compress(
+            content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY,
+        )
+
+    results = {}
+    for name, renderer_class in RENDERERS.items():
+        renderer = renderer_class()
+        content, encode_ms = _timed(lambda: renderer.render(data), iterations)
+        stats = results[name] = {'bytes': len(content), 'encode_ms': encode_ms}
+        for encoding, compress in codecs.items():
+            compressed, compress_ms = _timed(lambda: compress(content), iterations)
+            stats[f'{encoding}_bytes'] = len(compressed)
+            stats[f'{encoding}_ms'] = compress_ms
+    return results
+
+
+def run(size='medium', questions=100, iterations=20, seed=0):
+    with test_database():
+        seed_dataset(size, seed)
+        return measure(payload(questions), iterations)
@@ -0,0 +1,90 @@
+"""
+Sparse fieldsets for serializers (``?fields=`` / ``?expand=``).
+
+``fields=id,title,tags.name,answers`` keeps only the named fields; dotted
+names reach into nested serializers, and a nested serializer named on its
+own keeps its default fields. ``expand=answers.likes`` adds optional fields
+that are left out by default (a serializer's ``expandable_fields``).
+Without ``fields`` every default field is sent, as before.
+
+Views pass the same ``FieldSelection`` to the serializer's
+``setup_eager_loading`` so the queryset skips what isn't sent: unused
+columns are deferred and unused relations are never prefetched.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def _tree(names):
+    tree = {}
+    for name in names:
+        node = tree
+        for part in name.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class FieldSelection:
+    def __init__(self, fields=None, expand=None):
+        # None: the serializer's defaults; otherwise {name: nested tree}
+        self.fields = fields
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None:
+            return cls()
+        fields = _names(request.query_params.get('fields'))
+        return cls(_tree(fields) if fields else None, _tree(_names(request.query_params.get('expand'))))
+
+    def child(self, name):
+        fields = self.fields.get(name) if self.fields is not None else None
+        return FieldSelection(fields or None, self.expand.get(name))
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return name in self.expand or (self.fields is not None and name in self.fields)
+
+
+class SparseFieldsMixin:
+    """Trims a serializer's fields to the request's ``FieldSelection``."""
+    expandable_fields = ()
+
+    @property
+    def selection(self):
+        if 'selection' not in self.context:
+            self.context['selection'] = FieldSelection.from_request(self.context.get('request'))
+        selection = self.context['selection']
+
+        # The nested field names from the root, e.g. ['answers'] for a question's answer
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        for name in reversed(path):
+            selection = selection.child(name)
+        return selection
+
+    def is_expanded(self, name):
+        return self.selection.expands(name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expanded = {name for name in self.expandable_fields if self.is_expanded(name)}
+        for name in set(self.expandable_fields) - expanded:
+            del fields[name]
+
+        selection = self.selection
+        if selection.fields is not None:
+            unknown = set(selection.fields) - set(fields)
+            if unknown:
+                raise ValidationError({'fields': [f'Unknown field: {name}' for name in sorted(unknown)]})
+            for name in set(fields) - set(selection.fields) - expanded:
+                del fields[name]
+        return fields
@@ -0,0 +1,174 @@
+"""
+Per-endpoint request metrics, exposed in the Prometheus text format.
+
+``RequestMetricsMiddleware`` times every request and counts its database
+queries through a connection execute wrapper (no query logging involved), then
+adds the numbers to in-process histograms keyed by URL name and method. Each
+worker process has its own histograms; Prometheus sums them across scrape
+targets. ``metrics_view`` serves them to callers presenting
+``METRICS_TOKEN`` and is disabled while that setting is empty.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+from .caching import get_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms per (URL name, method) and request counts per status code."""
+    histograms = {
+        'http_request_duration_seconds': ('Wall time spent handling the request.', LATENCY_BUCKETS),
+        'http_request_db_queries': ('Database queries issued by the request.', QUERY_BUCKETS),
+        'http_request_db_duration_seconds': ('Time spent waiting on the database.', LATENCY_BUCKETS),
+        'http_response_size_bytes': ('Response body size.', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._requests = {}
+
+    def observe(self, view, method, status, values):
+        with self._lock:
+            series = self._series.get((view, method))
+            if series is None:
+                series = self._series[(view, method)] = {
+                    name: Histogram(buckets) for name, (_, buckets) in self.histograms.items()
+                }
+            for name, value in values.items():
+                if value is not None:
+                    series[name].observe(value)
+            key = (view, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_requests_total Requests handled, by URL name, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+            for name, (help_text, buckets) in self.histograms.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), series in sorted(self._series.items()):
+                    histogram = series[name]
+                    labels = f'view="{view}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        lines += [
+            '# HELP response_cache_requests_total Response cache lookups (see stayconnected.caching).',
+            '# TYPE response_cache_requests_total counter',
+        ]
+        for view, stats in get_stats().items():
+            lines.append(f'response_cache_requests_total{{view="{view}",result="hit"}} {stats["hits"]}')
+            lines.append(f'response_cache_requests_total{{view="{view}",result="miss"}} {stats["misses"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, {
+            'http_request_duration_seconds': duration,
+            'http_request_db_queries': recorder.count,
+            'http_request_db_duration_seconds': recorder.duration,
+            'http_response_size_bytes': size,
+        })
+        self.log_if_slow(request, view, duration, recorder)
+        return response
+
+    @staticmethod
+    def log_if_slow(request, view, duration, recorder):
+        slow_ms, max_queries = settings.METRICS_SLOW_REQUEST_MS, settings.METRICS_SLOW_REQUEST_QUERIES
+        if (slow_ms is not None and duration * 1000 > slow_ms) or \
+                (max_queries is not None and recorder.count > max_queries):
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in the database',
+                request.method, request.path, view, duration * 1000, recorder.count, recorder.duration * 1000,
+            )
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,123 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a fixed, unique ordering.
+
+    The cursor stores the ordering values of the last row of a page, and the
+    next page is fetched with a range condition on those values, so every
+    page costs one index range scan no matter how deep the client scrolls.
+    The last field of the ordering must be unique (usually ``id``).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, queryset, view)
+        self.fields = [self._parse_field(field) for field in ordering]
+
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_position(self, obj):
+        return [getattr(obj, name) for name, _ in self.fields]
+
+    def seek_filter(self, position):
+        """
+        Rows strictly after ``position`` in the ordering, i.e.
+        ``(a, b, c) > (va, vb, vc)`` expanded for mixed directions.
+
+        The leading ``a >= va`` bound is redundant but lets the database
+        start the index range at the cursor instead of filtering from the top.
+        """
+        (first_name, first_desc), first_value = self.fields[0], position[0]
+        bound = Q(**{f'{first_name}__{"lte" if first_desc else "gte"}': first_value})
+
+        after = Q()
+        for index, ((name, descending), value) in enumerate(zip(self.fields, position)):
+            condition = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            for (prev_name, _), prev_value in zip(self.fields[:index], position[:index]):
+                condition &= Q(**{prev_name: prev_value})
+            after |= condition
+        return bound & after
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(payload.decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _parse_field(field):
+        return (field[1:], True) if field.startswith('-') else (field, False)
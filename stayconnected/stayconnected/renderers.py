@@ -0,0 +1,72 @@
+"""
+Response renderers and request parsers.
+
+``ORJSONRenderer``/``ORJSONParser`` replace DRF's JSON pair with orjson,
+which encodes several times faster with the same output. The
+MessagePack pair answers ``Accept: application/msgpack`` and reads
+``Content-Type: application/msgpack`` bodies: a smaller binary encoding of
+the same data, for clients that can decode it. Values neither library knows
+(lazy strings, ``Decimal``, ``timedelta``, ...) and datetimes go through
+DRF's JSON encoder, so every format carries the same strings.
+
+Enabled in ``REST_FRAMEWORK`` in settings.
+"""
+import msgpack
+import orjson
+from django.utils.http import parse_header_parameters
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.utils.encoders import JSONEncoder
+
+_encode_default = JSONEncoder().default
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(renderers.BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = _ORJSON_OPTIONS
+        # DRF's JSONRenderer honours "Accept: application/json; indent=4"; orjson only indents by 2
+        if accepted_media_type and 'indent' in parse_header_parameters(accepted_media_type)[1]:
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_encode_default, option=options)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
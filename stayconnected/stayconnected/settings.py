@@ -55,12 +55,16 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
     'user',
     'qa',
+    'tasks',
     'corsheaders',
     'drf_yasg',
     'rest_framework_swagger',
 ]
 
 MIDDLEWARE = [
+    'stayconnected.metrics.RequestMetricsMiddleware',
+    'stayconnected.db_routing.DatabaseRoutingMiddleware',
+    'stayconnected.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -95,17 +99,100 @@ WSGI_APPLICATION = 'stayconnected.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'stayconnected',
-        'USER': 'stayconnected',
-        'PASSWORD': 'stayconnected',
-        'HOST': '54.93.246.114',
-        'PORT': '5432',
-     }
+# Configured from the environment; the defaults are the shared development server.
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before reuse.
+# DB_POOL=1 uses psycopg 3's connection pool instead (needs psycopg[pool]).
+# DB_REPLICAS lists read replicas (host[:port], or file names for SQLite); see stayconnected.db_routing.
+
+def _database(**overrides):
+    database = {
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'stayconnected'),
+        'USER': os.environ.get('DB_USER', 'stayconnected'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'stayconnected'),
+        'HOST': os.environ.get('DB_HOST', '54.93.246.114'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.environ.get('DB_POOL') == '1':
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        }}
+    database.update(overrides)
+    return database
+
+
+def _replica(spec):
+    if 'sqlite' in os.environ.get('DB_ENGINE', ''):
+        return _database(NAME=spec, TEST={'MIRROR': 'default'})
+    host, _, port = spec.partition(':')
+    return _database(HOST=host, PORT=port or os.environ.get('DB_PORT', '5432'), TEST={'MIRROR': 'default'})
+
+
+DATABASES = {'default': _database()}
+for _number, _spec in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{_number}'] = _replica(_spec.strip())
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['stayconnected.db_routing.PrimaryReplicaRouter']
+# How long a user's reads stay on the primary after they wrote, to cover replication lag
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default, which only works with a single server process:
+# with several, point CACHE_BACKEND/CACHE_LOCATION at a shared backend (e.g.
+# django.core.cache.backends.filebased.FileBasedCache and a directory), or
+# cached responses miss invalidations made by the other processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'stayconnected'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
 }
 
+# Cached read responses (stayconnected.caching); a timeout of 0 turns it off
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
+
+
+# Background tasks (tasks.queue), processed by `manage.py run_tasks`.
+# TASKS_EAGER=1 runs them inline instead, e.g. for local development without a worker.
+TASKS_EAGER = os.environ.get('TASKS_EAGER', '') == '1'
+TASKS_LEASE_SECONDS = 300
+TASKS_RETRY_DELAY = 10
+
+# VOTES_WRITE_BEHIND=1 stages vote counter changes and applies them in batches (qa.votes),
+# at most VOTES_FLUSH_INTERVAL_MS after the first staged vote.
+VOTES_WRITE_BEHIND = os.environ.get('VOTES_WRITE_BEHIND', '') == '1'
+VOTES_FLUSH_INTERVAL_MS = int(os.environ.get('VOTES_FLUSH_INTERVAL_MS', 500))
+VOTES_FLUSH_BATCH = 5000
+
+# Activity counts half as much toward a question's trending score after this long (qa.trending).
+# Changing it needs `manage.py rebuild_trending`.
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+
+# Responses of at least this many bytes are sent gzip or Brotli compressed (stayconnected.compression);
+# Brotli needs the `brotli` package.
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 6
+
+# Request metrics (stayconnected.metrics). /metrics is served only when METRICS_TOKEN is set,
+# to requests with "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Log requests slower than this many milliseconds / issuing more queries than this (None: off)
+METRICS_SLOW_REQUEST_MS = int(os.environ['METRICS_SLOW_REQUEST_MS']) if os.environ.get('METRICS_SLOW_REQUEST_MS') else None
+METRICS_SLOW_REQUEST_QUERIES = int(os.environ['METRICS_SLOW_REQUEST_QUERIES']) \
+    if os.environ.get('METRICS_SLOW_REQUEST_QUERIES') else None
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,6 +232,14 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Square avatars rendered from profile photos by user.avatars (pixels)
+USER_AVATAR_SIZES = [32, 64, 128]
+USER_AVATAR_WEBP = True
+USER_AVATAR_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+# Render on a background thread pool; False renders inline when the upload commits
+USER_AVATAR_ASYNC = True
+USER_AVATAR_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -154,12 +249,24 @@ AUTH_USER_MODEL = 'user.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # if jwt fails
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # open access for registration/login
     ],
+    # orjson for JSON; MessagePack for clients sending "Accept: application/msgpack" (see stayconnected.renderers)
+    'DEFAULT_RENDERER_CLASSES': [
+        'stayconnected.renderers.ORJSONRenderer',
+        'stayconnected.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'stayconnected.renderers.ORJSONParser',
+        'stayconnected.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -167,12 +274,25 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'user.serializers.UserTokenRefreshSerializer',
 }
+# Seconds CachedJWTAuthentication keeps a user in memory (0 disables), and how many users
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+AUTH_USER_CACHE_SIZE = 10000
+# Build request.user from the token's id/username claims without a query (see user.authentication)
+AUTH_TRUST_TOKEN_CLAIMS = os.environ.get('AUTH_TRUST_TOKEN_CLAIMS') == '1'
+# Seconds between refreshes of the in-memory refresh token blacklist (user.blacklist) from the database
+AUTH_BLACKLIST_SYNC_SECONDS = 10
 # CORS_ALLOWED_ORIGINS = [
 #
 #     "http://localhost:5173",
 # ]
 
+# Seconds before the in-process tag bitmap index (qa.tag_index) is rebuilt from the database
+QA_TAG_INDEX_MAX_AGE = 300
+# Tag name -> id entries kept in memory by qa.tags for question creation
+QA_TAG_CACHE_SIZE = 1024
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_HEADERS = "*"
@@ -0,0 +1,29 @@
+"""
+Settings for the test suite and the benchmark command: a local SQLite
+database, tasks run inline and a fast password hasher, so neither needs the
+network.
+
+    python manage.py test --settings=stayconnected.settings_test
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    # Routes reads through stayconnected.db_routing; a mirror of default in tests
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_REPLICAS = ['replica1']
+
+TASKS_EAGER = True
+USER_AVATAR_ASYNC = False
+METRICS_SLOW_REQUEST_MS = None
+METRICS_SLOW_REQUEST_QUERIES = None
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
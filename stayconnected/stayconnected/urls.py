@@ -24,6 +24,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 from django.conf import settings
+from .metrics import metrics_view
 
 
 schema_view = get_schema_view(
@@ -38,6 +39,7 @@ urlpatterns = [
     path('api/', include('user.urls')),
     path('api/', include('qa.urls')),
     path('docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('metrics', metrics_view, name='metrics'),
 
 
 ]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stayconnected.settings')
 
 application = get_wsgi_application()
+
+# Build the tag index now rather than on the first request (with a preloading
+# server, once for all workers)
+from qa.tag_index import tag_index  # noqa: E402
+
+tag_index.warm_up()
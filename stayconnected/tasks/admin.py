@@ -0,0 +1,8 @@
+from django.contrib import admin
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'state', 'attempts', 'run_at', 'dedupe_key']
+    list_filter = ['state', 'name']
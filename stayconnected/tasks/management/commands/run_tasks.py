@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks.queue import claim, run
+
+
+def _run_in_thread(row):
+    try:
+        return run(row)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Process queued background tasks. Start as many of these processes as needed; '
+        'they coordinate through row locks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Tasks run concurrently per process.')
+        parser.add_argument('--batch', type=int, default=50, help='Tasks claimed per round trip.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='tasks') as executor:
+            while True:
+                rows = claim(options['batch'])
+                if not rows:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                for succeeded in executor.map(_run_in_thread, rows):
+                    done += succeeded
+                    failed += not succeeded
+        self.stdout.write(self.style.SUCCESS(f'Ran {done} task(s), {failed} failed.'))
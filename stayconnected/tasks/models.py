@@ -0,0 +1,35 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    # At most one pending task per key; enqueueing it again is a no-op
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'run_at'], name='tasks_task_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=Q(state='pending'), name='tasks_task_pending_dedupe',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name}{tuple(self.args)} [{self.state}]'
@@ -0,0 +1,107 @@
+"""
+A small database-backed task queue.
+
+``enqueue()`` inserts a row in the caller's transaction, so a task exists if
+and only if the write that caused it committed. With a ``dedupe_key`` there
+is at most one *pending* task per key: a burst of edits to one question
+leaves a single indexing row behind. A task that is already running does not
+count, so a change made while it runs still gets its own follow-up.
+
+Workers (``manage.py run_tasks``) claim due rows with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of worker processes can
+share the table. A task that raises is retried with exponential backoff up to
+``max_attempts`` times and then kept as failed. Rows whose worker died are
+reclaimed once their lease (``TASKS_LEASE_SECONDS``) runs out.
+
+With ``TASKS_EAGER`` set, tasks run inline when enqueued instead.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name, max_attempts=5):
+    """
+    Register a function as task ``name``. Its arguments must be JSON
+    serializable. The function gets an ``enqueue(*args, dedupe_key=None)``
+    attribute.
+    """
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        func.task_name = name
+        func.enqueue = lambda *args, dedupe_key=None, delay=None: enqueue(
+            name, *args, dedupe_key=dedupe_key, delay=delay,
+        )
+        return func
+    return decorator
+
+
+def enqueue(name, *args, dedupe_key=None, delay=None):
+    func, max_attempts = _registry[name]
+    if settings.TASKS_EAGER:
+        func(*args)
+        return
+    run_at = timezone.now() + timedelta(seconds=delay) if delay else timezone.now()
+    row = Task(name=name, args=list(args), dedupe_key=dedupe_key, max_attempts=max_attempts, run_at=run_at)
+    if dedupe_key is None:
+        row.save()
+    else:
+        # ON CONFLICT DO NOTHING against the pending-dedupe constraint
+        Task.objects.bulk_create([row], ignore_conflicts=True)
+
+
+def claim(limit, worker_lease=None):
+    """Lock up to ``limit`` due tasks, mark them running and return them."""
+    now = timezone.now()
+    lease = timedelta(seconds=worker_lease or settings.TASKS_LEASE_SECONDS)
+    with transaction.atomic():
+        due = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(Q(state=Task.PENDING, run_at__lte=now) | Q(state=Task.RUNNING, locked_at__lt=now - lease))
+            .order_by('run_at', 'id')[:limit]
+        )
+        tasks = list(due)
+        for row in tasks:
+            row.state, row.locked_at, row.attempts = Task.RUNNING, now, row.attempts + 1
+        Task.objects.bulk_update(tasks, ['state', 'locked_at', 'attempts'])
+    return tasks
+
+
+def run(row):
+    """Run a claimed task, then delete it or schedule its retry."""
+    try:
+        func, _ = _registry[row.name]
+        with transaction.atomic():
+            func(*row.args)
+    except Exception:
+        logger.exception('Task %s failed (attempt %s of %s)', row, row.attempts, row.max_attempts)
+        _retry_or_fail(row, traceback.format_exc())
+        return False
+    Task.objects.filter(pk=row.pk).delete()
+    return True
+
+
+def _retry_or_fail(row, error):
+    if row.attempts >= row.max_attempts:
+        Task.objects.filter(pk=row.pk).update(state=Task.FAILED, last_error=error, locked_at=None)
+        return
+    run_at = timezone.now() + timedelta(seconds=settings.TASKS_RETRY_DELAY * 2 ** (row.attempts - 1))
+    try:
+        with transaction.atomic():
+            Task.objects.filter(pk=row.pk).update(
+                state=Task.PENDING, run_at=run_at, last_error=error, locked_at=None,
+            )
+    except IntegrityError:
+        # A newer pending task with the same key was enqueued meanwhile and will do the work
+        Task.objects.filter(pk=row.pk).delete()
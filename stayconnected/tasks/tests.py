@@ -0,0 +1,57 @@
+from django.test import TestCase, override_settings
+
+from qa.models import Question
+from qa.search import get_search_backend
+from user.models import User
+from .models import Task
+from .queue import claim, run, task
+
+calls = []
+
+
+@task('tests.flaky', max_attempts=2)
+def flaky(value):
+    calls.append(value)
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=False)
+class QueueTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='p')
+        self.question = Question.objects.create(title='t', description='d', author=self.author)
+
+    def test_pending_tasks_are_deduplicated(self):
+        for i in range(5):
+            self.question.title = f'Running migrations {i}'
+            self.question.save()
+        key = f'qa.index_question:default:{self.question.id}'
+        self.assertEqual(Task.objects.filter(dedupe_key=key).count(), 1)
+        self.assertEqual(get_search_backend().search('migrations').count(), 0)
+
+        rows = claim(10)
+        # An edit while the indexing runs gets its own follow-up
+        self.question.title = 'Squashing migrations'
+        self.question.save()
+        self.assertEqual(Task.objects.filter(dedupe_key=key).count(), 2)
+        for row in rows:
+            self.assertTrue(run(row))
+        for row in claim(10):
+            self.assertTrue(run(row))
+        self.assertEqual(get_search_backend().search('squashing').count(), 1)
+
+    def test_retry_then_fail(self):
+        flaky.enqueue(1, dedupe_key='flaky')
+        [row] = [row for row in claim(10) if row.name == 'tests.flaky']
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            self.assertFalse(run(row))
+        self.assertEqual(Task.objects.get(pk=row.pk).state, Task.PENDING)
+
+        Task.objects.filter(pk=row.pk).update(run_at=row.run_at)
+        [row] = [row for row in claim(10) if row.name == 'tests.flaky']
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            self.assertFalse(run(row))
+        failed = Task.objects.get(pk=row.pk)
+        self.assertEqual(failed.state, Task.FAILED)
+        self.assertIn('boom', failed.last_error)
+        self.assertEqual(calls, [1, 1])
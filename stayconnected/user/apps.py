@@ -6,6 +6,6 @@ class UserConfig(AppConfig):
     name = 'user'
 
     def ready(self):
-        from . import signals
+        from . import blacklist, signals
 
 
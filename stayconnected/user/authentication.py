@@ -0,0 +1,110 @@
+"""
+JWT authentication without a ``User`` query on most requests.
+
+``CachedJWTAuthentication`` keeps the users it loads in an in-process LRU for
+``AUTH_USER_CACHE_TTL`` seconds. An entry only serves tokens whose ``ver``
+claim matches the ``token_version`` it was loaded with, and a token whose
+version is behind the database is rejected, so changing the password or
+is_active (which bumps the version, see user.signals) revokes the outstanding
+tokens everywhere. Saving or deleting a user, e.g. a status change, evicts it
+here at once; other processes notice within the TTL. Each request gets its own copy of the cached
+instance, so views may modify ``request.user`` freely.
+
+With ``AUTH_TRUST_TOKEN_CLAIMS`` the id and username are taken from the
+signed token without looking at the database at all. Other fields are then
+loaded on first access, one query each, and revocation only happens when the
+access token expires.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from stayconnected.db_routing import pin_if_recent_writer
+from .models import User
+from .tokens import USERNAME_CLAIM, VERSION_CLAIM
+
+
+class UserCache:
+    def __init__(self, ttl=None, size=None):
+        self._ttl, self._size = ttl, size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else settings.AUTH_USER_CACHE_TTL
+
+    @property
+    def size(self):
+        return self._size if self._size is not None else settings.AUTH_USER_CACHE_SIZE
+
+    def get(self, user_id, version):
+        """A copy of the cached user if it is fresh and at ``version`` (any version if None)."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic() or (version is not None and version != user.token_version):
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        return copy.copy(user)
+
+    def set(self, user):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._users[user.pk] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._users.move_to_end(user.pk)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        # Tokens issued before versions were added carry none
+        version = validated_token.get(VERSION_CLAIM)
+        pin_if_recent_writer(user_id)
+
+        if settings.AUTH_TRUST_TOKEN_CLAIMS and version is not None and USERNAME_CLAIM in validated_token:
+            return User.from_db(
+                User.objects.db, ['id', 'username', 'token_version'],
+                [user_id, validated_token[USERNAME_CLAIM], version],
+            )
+
+        return self.get_current_user(validated_token)
+
+    def get_current_user(self, validated_token):
+        """The token's user, from the cache if possible; raises if the token was revoked."""
+        version = validated_token.get(VERSION_CLAIM)
+        user = user_cache.get(validated_token.get(api_settings.USER_ID_CLAIM), version)
+        if user is None:
+            user = super().get_user(validated_token)
+            if version is not None and version != user.token_version:
+                raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+            user_cache.set(user)
+        return user
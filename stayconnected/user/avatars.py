@@ -0,0 +1,143 @@
+"""
+Profile photo validation and avatar generation.
+
+Uploads are checked with Pillow in the request, then the fixed avatar sizes
+(``USER_AVATAR_SIZES``, JPEG plus WebP when ``USER_AVATAR_WEBP``) are rendered
+on a thread pool once the upload is committed. Files are named after the
+SHA-256 of the original, so re-uploading the same photo reuses them, and the
+names are recorded in ``User.avatars`` as ``{"64": {"jpeg": ..., "webp": ...}}``.
+Until that finishes ``avatars`` is empty and clients fall back to
+``profile_photo``.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+from stayconnected.caching import invalidate, user_namespace
+from .authentication import user_cache
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'JPEG', 'PNG'}
+FORMATS = {'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True})}
+WEBP_FORMAT = ('WEBP', {'quality': 80, 'method': 4})
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def validate_image(upload):
+    """Reject files that are too large or that Pillow can't read as a JPEG/PNG."""
+    if getattr(upload, 'size', None) is None:
+        raise serializers.ValidationError('Upload a valid JPEG or PNG image.')
+    if upload.size > settings.USER_AVATAR_MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError(
+            f'Image is too large (max {settings.USER_AVATAR_MAX_UPLOAD_SIZE // (1024 * 1024)} MB).'
+        )
+    try:
+        with Image.open(upload) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Upload a valid JPEG or PNG image.')
+    finally:
+        upload.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError('Upload a valid JPEG or PNG image.')
+    return upload
+
+
+def _formats():
+    formats = dict(FORMATS)
+    if settings.USER_AVATAR_WEBP:
+        formats['webp'] = WEBP_FORMAT
+    return formats
+
+
+def _save(name, image, image_format, options):
+    if default_storage.exists(name):
+        return name
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    # The storage picks another name if a concurrent render got there first
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render_avatars(photo_name):
+    """Render every size of ``photo_name`` and return the ``User.avatars`` mapping."""
+    with default_storage.open(photo_name, 'rb') as photo:
+        data = photo.read()
+    digest = hashlib.sha256(data).hexdigest()
+    sizes = sorted(settings.USER_AVATAR_SIZES, reverse=True)
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding when the photo is much larger
+        image.draft('RGB', (sizes[0] * 2, sizes[0] * 2))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    avatars = {}
+    for size in sizes:
+        # Each size is cut from the previous, larger one
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        avatars[str(size)] = {
+            extension: _save(f'avatars/{digest[:2]}/{digest}_{size}.{extension}', image, image_format, options)
+            for extension, (image_format, options) in _formats().items()
+        }
+    return avatars
+
+
+def generate_avatars(user_id, photo_name):
+    try:
+        avatars = render_avatars(photo_name)
+        # Only if the photo was not replaced while this ran
+        if User.objects.filter(pk=user_id, profile_photo=photo_name).update(avatars=avatars):
+            user_cache.forget(user_id)
+            invalidate(user_namespace(user_id), 'users')
+    except Exception:
+        logger.exception('Could not generate avatars for user %s', user_id)
+    finally:
+        if settings.USER_AVATAR_ASYNC:
+            connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.USER_AVATAR_WORKERS, thread_name_prefix='avatars')
+        return _executor
+
+
+def schedule_avatars(user):
+    """Generate ``user``'s avatars once the current transaction commits."""
+    if not user.profile_photo:
+        return
+    user_id, photo_name = user.pk, user.profile_photo.name
+
+    def submit():
+        if settings.USER_AVATAR_ASYNC:
+            _get_executor().submit(generate_avatars, user_id, photo_name)
+        else:
+            generate_avatars(user_id, photo_name)
+
+    transaction.on_commit(submit)
+
+
+def avatar_urls(user, request=None):
+    """``User.avatars`` with storage names turned into (absolute, given a request) URLs."""
+    urls = {}
+    for size, files in (user.avatars or {}).items():
+        urls[size] = {
+            extension: request.build_absolute_uri(default_storage.url(name)) if request else default_storage.url(name)
+            for extension, name in files.items()
+        }
+    return urls
@@ -0,0 +1,71 @@
+"""
+In-memory copy of the refresh token blacklist.
+
+simplejwt checks ``BlacklistedToken`` with a query on every refresh. Instead
+``token_blacklist`` holds the jti (and expiry) of every blacklisted token
+that has not expired yet, which is all that can still be presented. It loads
+on first use, then every ``AUTH_BLACKLIST_SYNC_SECONDS`` fetches the rows
+blacklisted since the previous sync (re-reading a margin, for transactions
+that committed late) and drops expired entries. Tokens blacklisted in this
+process are added as soon as the transaction commits, so a logout takes
+effect here immediately and in other processes within the sync interval.
+
+Expired rows are never needed again; ``manage.py compact_tokens`` deletes
+them.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# Transactions taking longer than this to commit could be missed by a sync
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+class TokenBlacklist:
+    def __init__(self):
+        self._expires = {}
+        self._synced_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._expires = {}
+            self._synced_at = self._checked_at = None
+
+    def _sync(self):
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        if self._synced_at is not None:
+            rows = rows.filter(blacklisted_at__gte=self._synced_at - SYNC_OVERLAP)
+        self._expires.update(rows.values_list('token__jti', 'token__expires_at'))
+        self._expires = {jti: expires for jti, expires in self._expires.items() if expires > now}
+        self._synced_at = now
+
+    def contains(self, jti):
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= settings.AUTH_BLACKLIST_SYNC_SECONDS:
+                self._sync()
+                self._checked_at = time.monotonic()
+            return jti in self._expires
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._expires[jti] = expires_at
+
+
+token_blacklist = TokenBlacklist()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        outstanding = instance.token
+        transaction.on_commit(lambda: token_blacklist.add(outstanding.jti, outstanding.expires_at))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from user.avatars import render_avatars
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = 'Render avatars for profile photos that have none yet (e.g. uploaded before avatars existed).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every profile photo.')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_photo='').exclude(profile_photo__isnull=True)
+        if not options['all']:
+            users = users.filter(avatars={})
+        done = 0
+        for user_id, photo_name in users.values_list('id', 'profile_photo').iterator():
+            try:
+                avatars = render_avatars(photo_name)
+            except Exception as exc:
+                self.stderr.write(f'User {user_id}: {exc}')
+                continue
+            done += User.objects.filter(pk=user_id, profile_photo=photo_name).update(avatars=avatars)
+        self.stdout.write(self.style.SUCCESS(f'Rendered avatars for {done} user(s).'))
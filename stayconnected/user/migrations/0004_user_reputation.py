@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:07
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_reputation(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    Answer = apps.get_model('qa', 'Answer')
+    answers = Answer.objects.filter(author_id=OuterRef('pk')).values('author_id').annotate(total=Count('*'))
+    User.objects.update(
+        answer_count=Coalesce(Subquery(answers.values('total')), Value(0)),
+        reputation=F('like_count') * 10 - F('dislike_count') * 5 + F('accepted_count') * 15,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user', '0003_user_accepted_count_user_dislike_count_and_more'),
+        ('qa', '0005_answer_vote_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='answer_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='reputation',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-reputation', '-id'], name='user_reputation_idx'),
+        ),
+        migrations.RunPython(backfill_reputation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_user_reputation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatars',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
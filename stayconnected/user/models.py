@@ -1,6 +1,12 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.core.validators import FileExtensionValidator
+from django.db.models import F
+
+# Reputation points, stackoverflow style
+LIKE_REPUTATION = 10
+DISLIKE_REPUTATION = -5
+ACCEPTED_REPUTATION = 15
 
 
 class User(AbstractUser):
@@ -13,35 +19,83 @@ class User(AbstractUser):
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])],
     )
+    # Generated from profile_photo by user.avatars: {"<size>": {"jpeg": name, "webp": name}}
+    avatars = models.JSONField(default=dict, blank=True, editable=False)
     like_count = models.IntegerField(default=0)
     dislike_count = models.IntegerField(default=0)
     accepted_count = models.IntegerField(default=0)
+    # Derived from the counters above and stored so the leaderboard is an index scan
+    reputation = models.IntegerField(default=0)
+    answer_count = models.IntegerField(default=0)
+    # Carried in JWTs (user.tokens) and bumped when the password or is_active changes
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-reputation', '-id'], name='user_reputation_idx'),
+        ]
+
+    # Moved by F() deltas in user.signals and qa.accepting; reconcile_vote_counts recomputes them
+    COUNTER_FIELDS = {'like_count', 'dislike_count', 'accepted_count', 'reputation', 'answer_count'}
+    # Changing one of these invalidates the user's tokens (see user.signals)
+    REVOKING_FIELDS = {'password', 'is_active'}
+
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # Don't let a plain save() of a stale instance write old counters or token versions back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS | {'token_version'}
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def reputation_expression():
+        """
+        Reputation computed from the stored counters, usable in update()
+        """
+        return (
+            F('like_count') * LIKE_REPUTATION
+            + F('dislike_count') * DISLIKE_REPUTATION
+            + F('accepted_count') * ACCEPTED_REPUTATION
+        )
+
+    @staticmethod
+    def reputation_delta(likes=0, dislikes=0, accepted=0):
+        return likes * LIKE_REPUTATION + dislikes * DISLIKE_REPUTATION + accepted * ACCEPTED_REPUTATION
+
+    def compute_reputation(self):
+        return self.reputation_delta(self.like_count, self.dislike_count, self.accepted_count)
+
     def update_like_count(self):
         """
-        Update the total number of likes received across all answers.
-        Call this method whenever likes/dislikes change.
+        Recompute the total number of likes received across all answers from
+        the per-answer counters. Vote changes keep it current incrementally;
+        this is only needed to repair drift.
         """
         self.like_count = self.answers.aggregate(
-            total_likes=models.Count('likes')
+            total_likes=models.Sum('like_count')
         )['total_likes'] or 0
-        self.save()
+        self.reputation = self.compute_reputation()
+        self.save(update_fields=['like_count', 'reputation'])
 
     def update_dislike_count(self):
         """
-        Update the total number of dislikes received across all answers.
-        Call this method whenever likes/dislikes change.
+        Recompute the total number of dislikes received across all answers
+        from the per-answer counters. Vote changes keep it current
+        incrementally; this is only needed to repair drift.
         """
         self.dislike_count = self.answers.aggregate(
-            total_dislikes=models.Count('dislikes')
+            total_dislikes=models.Sum('dislike_count')
         )['total_dislikes'] or 0
-        self.save()
+        self.reputation = self.compute_reputation()
+        self.save(update_fields=['dislike_count', 'reputation'])
 
     def update_accepted_count(self):
         """
@@ -49,5 +103,6 @@ class User(AbstractUser):
         Call this method whenever an answer's is_correct status changes.
         """
         self.accepted_count = self.answers.filter(is_correct=True).count()
-        self.save()
+        self.reputation = self.compute_reputation()
+        self.save(update_fields=['accepted_count', 'reputation'])
 
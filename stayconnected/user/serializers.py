@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .authentication import CachedJWTAuthentication
+from .avatars import avatar_urls, schedule_avatars, validate_image
+from .tokens import UserRefreshToken
 
 User = get_user_model()
 
@@ -59,6 +63,32 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    avatars = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'created_at', 'status', 'profile_photo']
+        fields = ['id', 'username', 'email', 'created_at', 'status', 'profile_photo', 'avatars']
+
+    def get_avatars(self, obj):
+        return avatar_urls(obj, self.context.get('request'))
+
+    def validate_profile_photo(self, value):
+        return validate_image(value) if value else value
+
+    def update(self, instance, validated_data):
+        photo_changed = 'profile_photo' in validated_data
+        if photo_changed:
+            instance.avatars = {}
+        instance = super().update(instance, validated_data)
+        if photo_changed:
+            schedule_avatars(instance)
+        return instance
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh without blacklist queries, rejecting tokens revoked by a password change."""
+    token_class = UserRefreshToken
+
+    def validate(self, attrs):
+        CachedJWTAuthentication().get_current_user(self.token_class(attrs['refresh']))
+        return super().validate(attrs)
@@ -1,27 +1,102 @@
-from django.db.models.signals import post_save, m2m_changed
+from collections import defaultdict
+
+from django.db.models import F, Q
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from .authentication import user_cache
 from .models import User
-from qa.models import Answer
+from qa.models import Answer, Question
+from qa.votes import votes_changed
+from stayconnected.caching import invalidate, user_namespace
+
+# Fields shown next to questions and answers (see qa.serializers)
+DISPLAYED_FIELDS = {'username', 'email'}
+
 
+@receiver(votes_changed, sender=Answer)
+def update_vote_counts(sender, author_deltas, **kwargs):
+    # Authors moving by the same amounts share one UPDATE
+    authors_by_delta = defaultdict(list)
+    for author_id, delta in author_deltas.items():
+        if any(delta):
+            authors_by_delta[delta].append(author_id)
+    for (likes, dislikes), author_ids in authors_by_delta.items():
+        User.objects.filter(id__in=author_ids).update(
+            like_count=F('like_count') + likes,
+            dislike_count=F('dislike_count') + dislikes,
+            reputation=F('reputation') + User.reputation_delta(likes=likes, dislikes=dislikes),
+        )
+    invalidate(*[user_namespace(author_id) for author_id in author_deltas])
 
-@receiver(m2m_changed, sender=Answer.likes.through)
-def update_likes_count(sender, instance, action, **kwargs):
-    if action in ['post_add', 'post_remove', 'post_clear']:
-        instance.author.update_like_count()
 
+def _move_answer_counts(author_id, answers=0, accepted=0):
+    if answers or accepted:
+        User.objects.filter(pk=author_id).update(
+            answer_count=F('answer_count') + answers,
+            accepted_count=F('accepted_count') + accepted,
+            reputation=F('reputation') + User.reputation_delta(accepted=accepted),
+        )
+        invalidate(user_namespace(author_id))
 
-@receiver(m2m_changed, sender=Answer.dislikes.through)
-def update_dislikes_count(sender, instance, action, **kwargs):
-    if action in ['post_add', 'post_remove', 'post_clear']:
-        instance.author.update_dislike_count()
+
+@receiver(pre_save, sender=Answer)
+def stash_answer_correct(sender, instance, update_fields, **kwargs):
+    if not instance._state.adding and (update_fields is None or 'is_correct' in update_fields):
+        instance._correct_before = Answer.objects.filter(pk=instance.pk).values_list('is_correct', flat=True).first()
 
 
 @receiver(post_save, sender=Answer)
-def update_accepted_count(sender, instance, **kwargs):
-    if instance.is_correct:
-        user_profile, created = User.objects.get_or_create(username=instance.author.username)
-        user_profile.accepted_count = Answer.objects.filter(
-            author=instance.author,
-            is_correct=True
-        ).count()
-        user_profile.save()
+def update_answer_author_counts(sender, instance, created, **kwargs):
+    before = getattr(instance, '_correct_before', None)
+    instance._correct_before = None
+    if created:
+        _move_answer_counts(instance.author_id, answers=1, accepted=int(instance.is_correct))
+    elif before is not None:
+        _move_answer_counts(instance.author_id, accepted=int(instance.is_correct) - int(before))
+
+
+@receiver(post_delete, sender=Answer)
+def discount_deleted_answer(sender, instance, **kwargs):
+    _move_answer_counts(instance.author_id, answers=-1, accepted=-int(instance.is_correct))
+
+
+@receiver(pre_save, sender=User)
+def stash_saved_fields(sender, instance, update_fields, **kwargs):
+    watched = DISPLAYED_FIELDS | User.REVOKING_FIELDS
+    if instance.pk and (update_fields is None or watched & set(update_fields)):
+        instance._saved_before = User.objects.filter(pk=instance.pk).values(*watched).first()
+
+
+def _changed(instance, fields):
+    before = getattr(instance, '_saved_before', None)
+    return bool(before) and any(before[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=User)
+def touch_displayed_questions(sender, instance, **kwargs):
+    if _changed(instance, DISPLAYED_FIELDS):
+        Question.touch(
+            Question.objects.filter(Q(author=instance) | Q(answers__author=instance)).values('id')
+        )
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens(sender, instance, **kwargs):
+    if _changed(instance, User.REVOKING_FIELDS):
+        User.objects.filter(pk=instance.pk).update(token_version=F('token_version') + 1)
+        instance.refresh_from_db(fields=['token_version'])
+    instance._saved_before = None
+    user_cache.forget(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_responses(sender, instance, update_fields, **kwargs):
+    invalidate(user_namespace(instance.pk))
+    if update_fields is None or DISPLAYED_FIELDS & set(update_fields):
+        invalidate('users')
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_responses(sender, instance, **kwargs):
+    invalidate(user_namespace(instance.pk), 'users')
+    user_cache.forget(instance.pk)
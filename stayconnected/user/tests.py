@@ -1,3 +1,229 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from qa.models import Answer, Question
+from qa.votes import reconcile_vote_counts
+from tasks.models import Task
+from .authentication import CachedJWTAuthentication, user_cache
+from .blacklist import token_blacklist
+from .models import User
+from .tokens import UserRefreshToken
+
+
+class UserAPITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', email='asker@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+
+class ReputationTests(UserAPITestCase):
+    def test_counters_and_leaderboard(self):
+        users = [User.objects.create_user(username=f'u{i}', email=f'u{i}@example.com', password='p') for i in range(5)]
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        for i, author in enumerate(users):
+            answer = Answer.objects.create(text='a', author=author, question=question)
+            answer.likes.add(*users[:i])
+        answer.is_correct = True
+        answer.save()
+        answer.dislikes.add(self.user)
+
+        top = users[-1]
+        top.refresh_from_db()
+        self.assertEqual((top.like_count, top.accepted_count, top.answer_count), (4, 1, 1))
+        self.assertEqual(top.reputation, 4 * 10 + 15 - 5)
+        self.assertEqual(self.client.get(f'/api/users/{top.id}/reputation/').data['reputation'], 50)
+
+        ids, url = [], '/api/users/reputation/?page_size=2'
+        response = self.client.get(url)
+        self.assertEqual(response.data['users'][0]['user_id'], top.id)
+        while url:
+            response = self.client.get(url)
+            ids += [user['user_id'] for user in response.data['users']]
+            url = response.data['next']
+        self.assertEqual(len(set(ids)), 6)
+
+        User.objects.filter(id=top.id).update(reputation=0, answer_count=9)
+        reconcile_vote_counts()
+        top.refresh_from_db()
+        self.assertEqual((top.reputation, top.answer_count), (50, 1))
+
+        answer.delete()
+        top.refresh_from_db()
+        self.assertEqual((top.answer_count, top.like_count, top.accepted_count, top.reputation), (0, 0, 0, 0))
+
+
+    @override_settings(TASKS_EAGER=False)
+    def test_counters_move_without_a_worker(self):
+        author = User.objects.create_user(username='author', email='author@example.com', password='p')
+        question = Question.objects.create(title='t', description='d', author=self.user)
+        answer = Answer.objects.create(text='a', author=author, question=question)
+        self.client.post(f'/api/answers/{answer.id}/like/')
+        answer.is_correct = True
+        answer.save()
+        author.refresh_from_db()
+        self.assertEqual((author.answer_count, author.like_count, author.accepted_count, author.reputation), (1, 1, 1, 25))
+
+        answer.is_correct = False
+        answer.save()
+        author.refresh_from_db()
+        self.assertEqual((author.accepted_count, author.reputation), (0, 10))
+        self.assertFalse(Task.objects.filter(name__startswith='user.').exists())
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), USER_AVATAR_ASYNC=False)
+class AvatarTests(UserAPITestCase):
+    def image(self, image_format='JPEG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), (200, 10, 10)).save(buffer, image_format)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_renders_avatars(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/profile/', {'profile_photo': self.image()}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        avatars = self.client.get('/api/profile/').data['avatars']
+        self.assertEqual(set(avatars), {'32', '64', '128'})
+        self.assertTrue(avatars['64']['webp'].startswith('http://testserver/media/avatars/'))
+        with default_storage.open(User.objects.get(pk=self.user.pk).avatars['64']['jpeg']) as file:
+            self.assertEqual(Image.open(file).size, (64, 64))
+
+        self.client.delete('/api/profile/')
+        self.assertEqual(User.objects.get(pk=self.user.pk).avatars, {})
+
+    def test_settings_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/user/settings/', {'profile_photo': self.image('PNG')},
+                                         format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(set(User.objects.get(pk=self.user.pk).avatars), {'32', '64', '128'})
+
+    def test_rejects_non_images(self):
+        bad = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        self.assertEqual(self.client.post('/api/profile/', {'profile_photo': bad}, format='multipart').status_code, 400)
+        bad.seek(0)
+        response = self.client.patch('/api/user/settings/', {'profile_photo': bad}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class AuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', email='asker@example.com', password='password')
+        self.client = APIClient()
+        user_cache.clear()
+        cache.clear()
+
+    def authorize(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(user).access_token}')
+
+    def test_users_are_cached_per_token_version(self):
+        self.authorize(self.user)
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/profile/').data['username'], 'asker')
+
+        self.client.patch('/api/user/settings/', {'username': 'renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/profile/').data['username'], 'renamed')
+
+    def test_password_change_revokes_tokens(self):
+        self.authorize(self.user)
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        self.client.patch('/api/user/settings/', {'password': 'Another-password-1'}, format='json')
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+        self.client.credentials()
+        response = self.client.post('/api/login/', {'identifier': 'asker', 'password': 'Another-password-1'},
+                                    format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["tokens"]["access"]}')
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+
+    def test_status_change_deactivation_and_deletion(self):
+        self.authorize(self.user)
+        self.client.get('/api/profile/')
+        self.user.status = 'away'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').data['status'], 'away')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.authorize(self.user)
+        self.client.get('/api/profile/')
+        self.user.delete()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=True)
+    def test_trusted_claims(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(0):
+            user = CachedJWTAuthentication().get_user(token)
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'asker'))
+        self.assertEqual(user.email, 'asker@example.com')
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='asker', email='asker@example.com', password='password')
+        self.client = APIClient()
+        token_blacklist.reset()
+        user_cache.clear()
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_logout_blacklists_in_memory(self):
+        token = UserRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token).status_code, 200)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/logout/', {'refresh_token': str(token)}, format='json')
+        self.assertEqual(response.status_code, 205)
+        self.client.credentials()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token).status_code, 401)
+
+    @override_settings(AUTH_BLACKLIST_SYNC_SECONDS=0)
+    def test_syncs_tokens_blacklisted_elsewhere(self):
+        token = UserRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        outstanding = OutstandingToken.objects.get(jti=token['jti'])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)])
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_password_change_revokes_refresh_tokens(self):
+        token = UserRefreshToken.for_user(self.user)
+        self.user.set_password('Another-password-1')
+        self.user.save()
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_compaction(self):
+        now = timezone.now()
+        for i, expires_at in enumerate([now - timedelta(days=2)] * 5 + [now + timedelta(days=1)] * 2):
+            outstanding = OutstandingToken.objects.create(jti=f'jti-{i}', token='-', expires_at=expires_at)
+            if i % 2:
+                BlacklistedToken.objects.create(token=outstanding)
+
+        out = io.StringIO()
+        call_command('compact_tokens', batch_size=2, pause=0, stdout=out)
+        self.assertIn('Deleted 2 blacklisted and 5 outstanding', out.getvalue())
+        self.assertEqual(sorted(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-5', 'jti-6'])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
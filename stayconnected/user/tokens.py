@@ -0,0 +1,28 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .blacklist import token_blacklist
+
+VERSION_CLAIM = 'ver'
+USERNAME_CLAIM = 'username'
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's ``token_version`` and username; access
+    tokens derived from it copy both claims. The blacklist is checked in
+    memory (see user.blacklist).
+    """
+
+    def check_blacklist(self):
+        if token_blacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[VERSION_CLAIM] = user.token_version
+        token[USERNAME_CLAIM] = user.username
+        return token
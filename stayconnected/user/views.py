@@ -1,8 +1,6 @@
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.messages.storage import default_storage
-from django.core.paginator import Paginator, EmptyPage
 from django.db import transaction
-from django.db.models import Sum, F
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, viewsets, permissions
@@ -10,14 +8,17 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from rest_framework.parsers import MultiPartParser, FormParser
 from .models import User
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer, UserProfileSerializer
+from .avatars import avatar_urls, schedule_avatars, validate_image
+from .tokens import UserRefreshToken
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.exceptions import TokenError
+from stayconnected.caching import cache_response, user_namespace
+from stayconnected.pagination import KeysetPagination
 
 
 class UserRegistrationView(APIView):
@@ -27,7 +28,7 @@ class UserRegistrationView(APIView):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
 
             return Response({
                 'message': 'Registration successful',
@@ -90,7 +91,7 @@ class UserLoginView(APIView):
 
                 # Check password
                 if user.check_password(password):
-                    refresh = RefreshToken.for_user(user)
+                    refresh = UserRefreshToken.for_user(user)
                     return Response({
                         'tokens': {
                             'refresh': str(refresh),
@@ -123,7 +124,7 @@ class UserLogoutView(APIView):
                 return Response({'error': 'Refresh token is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
             # Blacklist the token
-            token = RefreshToken(refresh_token)
+            token = UserRefreshToken(refresh_token)
             token.blacklist()
 
             return Response({'message': 'Logged out successfully.'}, status=status.HTTP_205_RESET_CONTENT)
@@ -137,12 +138,12 @@ class UserProfileView(APIView):
 
     def get(self, request):
         user = request.user
-        serializer = UserProfileSerializer(user)
+        serializer = UserProfileSerializer(user, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
         user = request.user
-        serializer = UserProfileSerializer(user, data=request.data, partial=True)
+        serializer = UserProfileSerializer(user, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -153,6 +154,7 @@ class UserProfileView(APIView):
         if user.profile_photo:
             user.profile_photo.delete()
             user.profile_photo = None
+            user.avatars = {}
             user.save()
             return Response({"message": "Profile photo removed."}, status=status.HTTP_200_OK)
         return Response({"error": "No profile photo to remove."}, status=status.HTTP_400_BAD_REQUEST)
@@ -186,7 +188,11 @@ class UserSettingsView(APIView):
             # if user.profile_photo:
             #     default_storage.delete(user.profile_photo.path)  # this correct?
 
-            user.profile_photo = data['profile_photo']
+            try:
+                user.profile_photo = validate_image(data['profile_photo'])
+            except ValidationError as e:
+                return Response({'profile_photo': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+            user.avatars = {}
 
         if 'password' in data:
             new_password = data['password']
@@ -207,72 +213,70 @@ class UserSettingsView(APIView):
                 {'detail': e.message_dict},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if 'profile_photo' in data:
+            schedule_avatars(user)
 
-        serializer = UserProfileSerializer(user)
+        serializer = UserProfileSerializer(user, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class UserReputationAPIView(APIView):
+    @cache_response(lambda request, user_id: [user_namespace(user_id)])
     def get(self, request, user_id):
         user = get_object_or_404(User, id=user_id)
 
-        likes_count = user.like_count
-        dislikes_count = user.dislike_count
-        accepted_count = user.accepted_count
-
-        # Calculate reputation to look more like stackoverflow
-        reputation = 10 * likes_count - 5 * dislikes_count + 15 * accepted_count
-
         return Response({
             "user_id": user_id,
-            "likes": likes_count,
-            "dislikes": dislikes_count,
-            "reputation": reputation,
-            "answers_count": user.answers.count(),
+            "likes": user.like_count,
+            "dislikes": user.dislike_count,
+            "reputation": user.reputation,
+            "answers_count": user.answer_count,
             "accepted_answers": user.accepted_count,
         })
 
 
-class UserReputationListAPIView(APIView):
-    def get(self, request):
-        ordering = request.query_params.get('ordering', '-reputation_score')
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 20))
+class LeaderboardPagination(KeysetPagination):
+    page_size = 20
+    orderings = {
+        '-reputation': ('-reputation', '-id'),
+        'reputation': ('reputation', 'id'),
+    }
+    # Names accepted before reputation became a stored column
+    aliases = {
+        '-reputation_score': '-reputation',
+        'reputation_score': 'reputation',
+    }
 
-        users = User.objects.annotate(
-            reputation_score=F('like_count') * 10 - F('dislike_count') * 5 + F('accepted_count') * 15
-        )
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering', '-reputation')
+        return self.orderings.get(self.aliases.get(ordering, ordering), self.orderings['-reputation'])
 
-        users = users.order_by(ordering)
-        paginator = Paginator(users, page_size)
 
-        try:
-            page_obj = paginator.page(page)
-        except EmptyPage:
-            return Response({
-                'error': 'Page not found',
-                'total_pages': paginator.num_pages
-            }, status=status.HTTP_404_NOT_FOUND)
+class UserReputationListAPIView(APIView):
+    pagination_class = LeaderboardPagination
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(User.objects.all(), request, view=self)
 
         user_data = []
-        for user in page_obj:
+        for user in page:
             user_data.append({
                 "user_id": user.id,
                 "username": user.username,
-                "reputation_score": user.reputation_score,
+                "reputation_score": user.reputation,
                 "likes": user.like_count,
                 "dislikes": user.dislike_count,
-                "answers_count": user.answers.count(),
+                "answers_count": user.answer_count,
                 "accepted_answers": user.accepted_count,
                 "profile_photo": request.build_absolute_uri(user.profile_photo.url) if user.profile_photo else None,
+                "avatars": avatar_urls(user, request),
             })
 
         return Response({
             'users': user_data,
-            'total_users': paginator.count,
-            'total_pages': paginator.num_pages,
-            'current_page': page,
-            'page_size': page_size,
+            'next': paginator.get_next_link(),
+            'page_size': paginator.page_size,
         })
 
 